@@ -1,4 +1,9 @@
 import dash
+import pandas as pd
+
+# Frames handed out by the dataset registry are shared, copy on write keeps
+# changes of a page in its own copy
+pd.set_option('mode.copy_on_write', True)
 
 # Create the Dash app
 app = dash.Dash(__name__, suppress_callback_exceptions=True)
@@ -0,0 +1,503 @@
+# Imports
+import os
+import json
+import time
+import hashlib
+import logging
+import argparse
+import threading
+from pathlib import Path
+from dataclasses import dataclass, field
+import pandas as pd
+from app.datastore import DATA_DIR, arrow_path, is_converted, read_dataset
+
+logger = logging.getLogger(__name__)
+
+# Time baskets of the release time page, in their natural order
+RELEASE_BINS = ['0 days', '<1 week', '1-2 weeks', '2-3 weeks', '3-4 weeks', '4+ weeks']
+
+
+@dataclass(frozen=True)
+class Schema:
+    '''
+    Column types of a dataset. Columns that are missing in the file are
+    skipped, all other columns keep the types pandas parses.
+
+    Attributes:
+        file (str): Name of the csv file in data/final_data.
+        categories (tuple): Columns with few distinct strings.
+        ordered (dict): Categorical columns with a fixed order of categories.
+        integers (dict): Integer columns and their numpy type, e.g. 'int16'.
+        floats (dict): Float columns and their numpy type.
+        dates (tuple): Columns with dates, invalid dates become NaT.
+        bools (tuple): Columns with True/False, missing values become False.
+        texts (tuple): Columns with long texts like lyrics. They are dropped
+        from the frame and read from the lyrics store with get_lyrics.
+    '''
+    file: str
+    categories: tuple = ()
+    ordered: dict = field(default_factory=dict)
+    integers: dict = field(default_factory=dict)
+    floats: dict = field(default_factory=dict)
+    dates: tuple = ()
+    bools: tuple = ()
+    texts: tuple = ()
+
+
+# The datasets of the pages
+SCHEMAS = {
+    'genres_daily': Schema(
+        file='global_17-24_daily_with_exploded_genres.csv',
+        categories=('genres', 'artist_names', 'track_name', 'uri', 'source'),
+        integers={'rank': 'int16', 'previous_rank': 'int16', 'peak_rank': 'int16',
+                  'weeks_on_chart': 'int16', 'days_on_chart': 'int16'},
+        dates=('date',)),
+    'global_daily': Schema(
+        file='global_17-24_daily.csv',
+        categories=('artist_names', 'track_name', 'uri', 'source'),
+        integers={'rank': 'int16', 'previous_rank': 'int16', 'peak_rank': 'int16',
+                  'weeks_on_chart': 'int16', 'days_on_chart': 'int16'},
+        dates=('date',)),
+    'covid': Schema(
+        file='covid.csv',
+        categories=('Country_code', 'Country', 'WHO_region'),
+        dates=('Date_reported',)),
+    'regions_24': Schema(
+        file='all_regions_24.csv',
+        categories=('country', 'artist_names', 'track_name', 'uri', 'source'),
+        integers={'rank': 'int16', 'previous_rank': 'int16', 'peak_rank': 'int16',
+                  'weeks_on_chart': 'int16', 'days_on_chart': 'int16'},
+        dates=('date',)),
+    'charts_summary': Schema(
+        file='global_17-24_with_spotifyextras.csv',
+        categories=('artist_names', 'source', 'album_name'),
+        ordered={'relase-chart_days_bins': RELEASE_BINS},
+        integers={'max_peak_rank': 'int16', 'min_peak_rank': 'int16',
+                  'max_days_on_chart': 'int32', 'count': 'int32', 'duration_ms': 'int32',
+                  'popularity': 'int16', 'track_number': 'int16', 'album_total_tracks': 'int16',
+                  'relase-chart_days': 'int32', 'chart-best_days': 'int32',
+                  'release-best_days': 'int32', 'artist_count': 'int16'},
+        dates=('first_appearance', 'best_day_date', 'release_date'),
+        bools=('explicit', 'is_local', 'is_colab')),
+    'lyrics': Schema(
+        file='all_locations_with_polarity_and_spotify.csv',
+        categories=('location', 'artist_names', 'source', 'album_name'),
+        integers={'max_peak_rank': 'int16', 'min_peak_rank': 'int16',
+                  'max_days_on_chart': 'int32', 'count': 'int32', 'duration_ms': 'int32',
+                  'popularity': 'int16', 'year': 'int16'},
+        floats={'polarity': 'float32', 'duration_seconds': 'float32'},
+        dates=('first_appearance', 'best_day_date'),
+        bools=('explicit', 'is_local'),
+        texts=('lyrics',)),
+    'lyrics_unique': Schema(
+        file='all_locations_with_polarity_and_spotify_without_duplicates.csv',
+        categories=('location', 'artist_names', 'source', 'album_name'),
+        integers={'max_peak_rank': 'int16', 'min_peak_rank': 'int16',
+                  'max_days_on_chart': 'int32', 'count': 'int32', 'duration_ms': 'int32',
+                  'popularity': 'int16', 'year': 'int16'},
+        floats={'polarity': 'float32', 'duration_seconds': 'float32'},
+        dates=('first_appearance', 'best_day_date'),
+        bools=('explicit', 'is_local'),
+        texts=('lyrics',)),
+}
+
+# Name of the manifest file written into the data folder
+MANIFEST_FILE = 'manifest.json'
+
+
+class Snapshot:
+    '''
+    The parsed datasets of one version of the data folder. A new snapshot is
+    built next to the current one and replaces it in a single assignment, so
+    a request always sees the datasets of one version.
+
+    Attributes:
+        version (str): Hash of all file hashes in the manifest.
+        manifest (dict): Per file name its 'sha256', 'size' and 'mtime_ns'.
+        frames (dict): The parsed datasets of this version, keyed by name.
+        lyrics (dict): The opened lyrics stores of this version, keyed by
+        dataset name and column.
+    '''
+
+    def __init__(self, manifest, frames=None):
+        self.manifest = manifest
+        self.version = manifest_version(manifest)
+        self.frames = frames or {}
+        self.lyrics = {}
+
+
+# The current snapshot of this process, None until the data is first used
+_snapshot = None
+_snapshot_lock = threading.Lock()
+_lyrics_lock = threading.Lock()
+
+
+def data_path(name):
+    # The csv file of a dataset
+    return DATA_DIR / SCHEMAS[name].file
+
+
+def _integer(column, dtype):
+    # Columns with missing values need the nullable integer type
+    if column.isna().any():
+        return column.astype(dtype.capitalize())
+    return column.astype(dtype)
+
+
+def apply_schema(df, schema):
+    '''
+    Casts the columns of a dataset to the types of its schema. Columns that
+    already have their type, like those read from the arrow store, are kept.
+
+    Arguments:
+        df (pandas.DataFrame): The parsed dataset.
+        schema (Schema): The column types.
+
+    Returns:
+        pandas.DataFrame: The dataset with compact column types.
+    '''
+    casts = {}
+    for col in schema.dates:
+        casts[col] = lambda c: pd.to_datetime(c, errors='coerce')
+    for col in schema.bools:
+        casts[col] = lambda c: c.fillna(False).astype(bool)
+    for col, dtype in schema.integers.items():
+        casts[col] = lambda c, dtype=dtype: _integer(c, dtype)
+    for col, dtype in schema.floats.items():
+        casts[col] = lambda c, dtype=dtype: c.astype(dtype)
+    for col in schema.categories:
+        casts[col] = lambda c: c.astype('category')
+    for col, order in schema.ordered.items():
+        casts[col] = lambda c, order=order: c.astype(pd.CategoricalDtype(order, ordered=True))
+
+    for col, cast in casts.items():
+        if col not in df.columns:
+            continue
+        column = cast(df[col])
+        if column.dtype != df[col].dtype:
+            df[col] = column
+
+    # Long texts are only kept in the lyrics store
+    return df.drop(columns=[col for col in schema.texts if col in df.columns])
+
+
+def prepare(csv_path):
+    '''
+    Returns the schema cast for a csv file of data/final_data, used by the
+    arrow store so the converted files keep the compact types.
+
+    Arguments:
+        csv_path (str or Path): The csv file.
+
+    Returns:
+        callable or None: Casts a parsed frame, None for files without schema.
+    '''
+    for schema in SCHEMAS.values():
+        if schema.file == Path(csv_path).name:
+            return lambda df: apply_schema(df, schema)
+    return None
+
+
+def file_hash(path):
+    '''
+    Returns the content hash of a file, read in blocks of 1 MB.
+
+    Arguments:
+        path (str or Path): The file.
+
+    Returns:
+        str: Hex sha256 of the file.
+    '''
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(2**20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _data_files(data_dir):
+    # The data files of the manifest by name, with the arrow files of the csv
+    # files, so converting the data is noticed like a changed file
+    files = {path.name: path for path in sorted(Path(data_dir).iterdir())
+             if path.is_file() and path.name != MANIFEST_FILE and not path.name.startswith('.')}
+    for path in list(files.values()):
+        arrow = arrow_path(path)
+        if path.suffix == '.csv' and arrow.exists():
+            files[_arrow_name(path)] = arrow
+    return files
+
+
+def _arrow_name(csv_path):
+    # Name of the arrow file of a csv file in the manifest
+    arrow = arrow_path(csv_path)
+    return f'{arrow.parent.name}/{arrow.name}'
+
+
+def file_stats(data_dir=DATA_DIR):
+    '''
+    Returns the size and modification time of every file of the manifest,
+    which is cheap compared to hashing them.
+
+    Arguments:
+        data_dir (Path): The data folder.
+
+    Returns:
+        dict: Per file name its size and mtime_ns.
+    '''
+    stats = {}
+    for name, path in _data_files(data_dir).items():
+        stat = path.stat()
+        stats[name] = (stat.st_size, stat.st_mtime_ns)
+    return stats
+
+
+def build_manifest(data_dir=DATA_DIR, previous=None):
+    '''
+    Builds the content hash manifest of the data files.
+
+    Files whose size and modification time did not change since the previous
+    manifest keep their hash, so only changed files are read again.
+
+    Arguments:
+        data_dir (Path): The data folder. Of its subfolders only the arrow
+        files of the csv files are part of the manifest.
+        previous (dict): An earlier manifest of the same folder.
+
+    Returns:
+        dict: Per file name its 'sha256', 'size' and 'mtime_ns'.
+    '''
+    previous = previous or {}
+    manifest = {}
+    for name, path in _data_files(data_dir).items():
+        stat = path.stat()
+        entry = previous.get(name)
+        if entry is None or (entry['size'], entry['mtime_ns']) != (stat.st_size, stat.st_mtime_ns):
+            entry = {'sha256': file_hash(path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+        manifest[name] = entry
+    return manifest
+
+
+def manifest_version(manifest):
+    # Short hash over the names and hashes of all files
+    digest = hashlib.sha256()
+    for name, entry in sorted(manifest.items()):
+        digest.update(f'{name}:{entry["sha256"]}\n'.encode())
+    return digest.hexdigest()[:16]
+
+
+def _current_snapshot():
+    global _snapshot
+    snapshot = _snapshot
+    if snapshot is None:
+        with _snapshot_lock:
+            if _snapshot is None:
+                _snapshot = Snapshot(build_manifest(DATA_DIR))
+            snapshot = _snapshot
+    return snapshot
+
+
+def dataset_hash(name):
+    '''
+    Returns the content hash of the file of a dataset in the current data
+    version, as listed in the manifest.
+
+    Arguments:
+        name (str): The name of the dataset in SCHEMAS.
+
+    Returns:
+        str or None: Hex sha256 of the file, None if the file is missing.
+    '''
+    entry = _current_snapshot().manifest.get(SCHEMAS[name].file)
+    return entry['sha256'] if entry is not None else None
+
+
+def data_version():
+    '''
+    Returns the version of the data folder, a hash of the contents of all its
+    files. Caches that store anything derived from the data use it as part of
+    their keys.
+
+    Returns:
+        str: The data version.
+    '''
+    return _current_snapshot().version
+
+
+def get_dataset(name):
+    '''
+    Returns a dataset of the pages, parsed once per process and data version
+    with the types of its schema.
+
+    Every call hands out a new shallow copy. With copy on write, columns a page
+    adds or changes stay in its copy and never reach the shared frame or the
+    memory mapped arrow file.
+
+    Arguments:
+        name (str): The name of the dataset in SCHEMAS.
+
+    Returns:
+        pandas.DataFrame: A read-only view of the dataset.
+    '''
+    snapshot = _current_snapshot()
+    df = snapshot.frames.get(name)
+    if df is None:
+        # Only one thread parses a dataset, the others wait and reuse it
+        with _snapshot_lock:
+            df = snapshot.frames.get(name)
+            if df is None:
+                df = apply_schema(read_dataset(data_path(name)), SCHEMAS[name])
+                snapshot.frames[name] = df
+    return df.copy(deep=False)
+
+
+def get_lyrics(name, column='lyrics'):
+    '''
+    Returns the lyrics store of a text column of a dataset, opened once per
+    process and data version. The store is built on first use if it is
+    missing or older than the csv file.
+
+    The rows of the store are the rows of the csv file, so the index of the
+    dataset, also after filtering, addresses the texts of its songs.
+
+    Arguments:
+        name (str): The name of the dataset in SCHEMAS.
+        column (str): One of the texts of its schema.
+
+    Returns:
+        app.lyrics_store.LyricsStore: The texts and token ids of the column.
+    '''
+    # The store needs nltk and is only imported by pages with texts
+    from app.lyrics_store import open_store
+
+    if column not in SCHEMAS[name].texts:
+        raise ValueError(f'{column} is no text column of the dataset {name}.')
+
+    snapshot = _current_snapshot()
+    store = snapshot.lyrics.get((name, column))
+    if store is None:
+        # Building a store takes a while, datasets can be parsed meanwhile
+        with _lyrics_lock:
+            store = snapshot.lyrics.get((name, column))
+            if store is None:
+                store = open_store(data_path(name), column)
+                snapshot.lyrics[(name, column)] = store
+    return store
+
+
+# Sizes and modification times of the data files at the last check that
+# found a change
+_changed_stats = None
+
+
+def reload_if_changed():
+    '''
+    Checks the data folder for changed files and swaps in a new snapshot if
+    the data version changed.
+
+    A changed file is only read once its size and modification time are the
+    same in two checks in a row, so a file that is still being copied is not
+    swapped in, even if the part copied so far parses.
+
+    Datasets that were already used and whose csv or arrow file changed are
+    read before the swap, so no request has to wait for them. Unchanged datasets are
+    carried over to the new snapshot.
+
+    Returns:
+        bool: True if a new version was swapped in.
+    '''
+    global _snapshot, _changed_stats
+    current = _current_snapshot()
+    stats = file_stats(DATA_DIR)
+    if stats == {name: (entry['size'], entry['mtime_ns']) for name, entry in current.manifest.items()}:
+        _changed_stats = None
+        return False
+    if stats != _changed_stats:
+        # Changed since the last check, the files may still be written
+        _changed_stats = stats
+        return False
+
+    manifest = build_manifest(DATA_DIR, current.manifest)
+    if manifest_version(manifest) == current.version:
+        # Only touched, keep the new times so the files are not hashed again
+        current.manifest = manifest
+        return False
+
+    frames = {}
+    for name, df in list(current.frames.items()):
+        path = data_path(name)
+        files = (path.name, _arrow_name(path))
+        if all(manifest.get(file) == current.manifest.get(file) for file in files):
+            frames[name] = df
+        elif path.name in manifest:
+            if arrow_path(path).exists() and not is_converted(path):
+                # Every worker keeps its own parsed copy until the data is
+                # converted again, which reloads it from the arrow file
+                logger.warning('%s changed after its conversion and is read from the csv, '
+                               'run python -m app.datastore convert', path.name)
+            frames[name] = apply_schema(read_dataset(path), SCHEMAS[name])
+
+    with _snapshot_lock:
+        _snapshot = Snapshot(manifest, frames)
+    return True
+
+
+_watcher_pid = None
+
+
+def start_watcher(interval=None):
+    '''
+    Starts a background thread that checks the data folder for changes every
+    interval seconds and swaps in the new data, so the data can be updated
+    without restarting the workers. A changed file is swapped in at the first
+    check after it stopped changing, see reload_if_changed.
+
+    Arguments:
+        interval (float): Seconds between two checks. None reads the
+        DATA_WATCH_INTERVAL environment variable, defaulting to 60. 0 turns
+        the watcher off.
+
+    Returns:
+        threading.Thread or None: The started thread, None if the watcher is
+        off or already runs in this process.
+    '''
+    global _watcher_pid
+    if interval is None:
+        interval = float(os.environ.get('DATA_WATCH_INTERVAL', 60))
+    if interval <= 0 or _watcher_pid == os.getpid():
+        return None
+    _watcher_pid = os.getpid()
+
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                reload_if_changed()
+            except Exception:
+                # The next check retries
+                logger.exception('Reloading the data failed')
+
+    thread = threading.Thread(target=run, name='data-watcher', daemon=True)
+    thread.start()
+    return thread
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Content hash manifest of the data in data/final_data.')
+    parser.add_argument('--write', action='store_true',
+                        help=f'Write the manifest to data/final_data/{MANIFEST_FILE}.')
+    args = parser.parse_args()
+
+    manifest = build_manifest(DATA_DIR)
+    for name, entry in manifest.items():
+        print(f'{entry["sha256"][:16]} {entry["size"] / 2**20:>8.1f} MB  {name}')
+    version = manifest_version(manifest)
+    print(f'Data version: {version}')
+
+    if args.write:
+        with open(DATA_DIR / MANIFEST_FILE, 'w') as file:
+            json.dump({'version': version, 'files': manifest}, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
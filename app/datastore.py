@@ -0,0 +1,206 @@
+# Imports
+import os
+import argparse
+import contextlib
+import multiprocessing
+from pathlib import Path
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+import psutil
+
+# Folder of the csv files read by the pages
+DATA_DIR = Path(__file__).resolve().parents[1] / 'data' / 'final_data'
+
+# Folder of the converted arrow files
+STORE_DIR = DATA_DIR / 'arrow'
+
+
+def arrow_path(csv_path):
+    # The arrow file of a csv file, named after the csv file
+    return STORE_DIR / (Path(csv_path).stem + '.arrow')
+
+
+@contextlib.contextmanager
+def atomic_write(path):
+    '''
+    Context manager for writing a file that readers never see half written.
+
+    The block writes to a temporary file next to path, unique per process,
+    which replaces path once the block finished. If the block raises, the
+    temporary file is removed and path stays as it was.
+
+    Arguments:
+        path (str or Path): The file to write.
+
+    Yields:
+        Path: The temporary file to write to.
+    '''
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f'.{path.name}.{os.getpid()}.tmp')
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+
+def _large_strings(table):
+    # pandas keeps pyarrow strings as large_string, storing them like that
+    # avoids a copy of the memory mapped column when reading
+    fields = [field.with_type(pa.large_string()) if pa.types.is_string(field.type) else field
+              for field in table.schema]
+    return table.cast(pa.schema(fields, metadata=table.schema.metadata))
+
+
+def convert(csv_path, prepare=None):
+    '''
+    Converts a csv file into an uncompressed arrow (feather v2) file, which
+    can be memory mapped by every worker instead of being parsed.
+
+    The csv is parsed by pandas, so the columns keep the types the pages were
+    written for.
+
+    Arguments:
+        csv_path (str or Path): The csv file to convert.
+        prepare (callable): Changes the parsed frame before it is written,
+        e.g. to cast its columns to compact types.
+
+    Returns:
+        Path: The written arrow file.
+    '''
+    df = pd.read_csv(csv_path)
+    if prepare is not None:
+        df = prepare(df)
+    table = _large_strings(pa.Table.from_pandas(df, preserve_index=False))
+
+    path = arrow_path(csv_path)
+    with atomic_write(path) as tmp_path:
+        feather.write_feather(table, tmp_path, compression='uncompressed')
+    return path
+
+
+def is_converted(csv_path):
+    # The csv file has an arrow file that was written after its last change
+    path = arrow_path(csv_path)
+    return path.exists() and path.stat().st_mtime >= Path(csv_path).stat().st_mtime
+
+
+def read_dataset(csv_path):
+    '''
+    Reads a dataset of the pages, memory mapped from its arrow file if one was
+    converted.
+
+    Numeric columns without missing values and string columns stay in the
+    mapped file, so all workers share one copy in the page cache. Strings come
+    back as pyarrow backed string columns. If no arrow file exists, or the csv
+    changed after the conversion, the csv is parsed as before.
+
+    Arguments:
+        csv_path (str or Path): The csv file of the dataset.
+
+    Returns:
+        pandas.DataFrame: The dataset.
+    '''
+    if not is_converted(csv_path):
+        return pd.read_csv(csv_path)
+
+    table = feather.read_table(arrow_path(csv_path), memory_map=True)
+    return table.to_pandas(split_blocks=True,
+                           types_mapper={pa.large_string(): pd.StringDtype('pyarrow')}.get)
+
+
+def _worker_memory(csv_paths, use_store):
+    # Runs in a fresh process, loads the datasets and keeps them referenced
+    process = psutil.Process()
+    before = process.memory_full_info()
+    frames = [read_dataset(p) if use_store else pd.read_csv(p) for p in csv_paths]
+    after = process.memory_full_info()
+    return {
+        'rows': sum(len(df) for df in frames),
+        'rss_mb': (after.rss - before.rss) / 2**20,
+        'uss_mb': (after.uss - before.uss) / 2**20,
+        'pss_mb': (getattr(after, 'pss', 0) - getattr(before, 'pss', 0)) / 2**20,
+    }
+
+
+def measure_memory(csv_paths, workers=4):
+    '''
+    Compares the memory of workers that parse the csv files with workers that
+    memory map the arrow files.
+
+    Every worker is a fresh process that loads all datasets and keeps them
+    while the others load theirs, like gunicorn workers. The unique memory
+    (uss) is what a worker adds on its own, the proportional memory (pss)
+    splits shared pages between the workers that map them.
+
+    Arguments:
+        csv_paths (list of Path): The datasets to load.
+        workers (int): Number of concurrent workers per mode.
+
+    Returns:
+        dict: Per mode ('csv', 'arrow') a list with the memory of every worker
+        in MB.
+    '''
+    context = multiprocessing.get_context('spawn')
+    results = {}
+    for mode, use_store in (('csv', False), ('arrow', True)):
+        with context.Pool(workers) as pool:
+            results[mode] = pool.starmap(_worker_memory, [(csv_paths, use_store)] * workers)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Memory mapped arrow store of the datasets in data/final_data.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    convert_parser = subparsers.add_parser('convert', help='Convert csv files to arrow.')
+    convert_parser.add_argument('files', nargs='*', type=Path,
+                                help='The csv files, all files in data/final_data by default.')
+
+    memory_parser = subparsers.add_parser(
+        'memory', help='Compare the worker memory of csv and arrow loading.')
+    memory_parser.add_argument('files', nargs='*', type=Path)
+    memory_parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args()
+
+    files = args.files or sorted(DATA_DIR.glob('*.csv'))
+
+    if args.command == 'convert':
+        # The files keep the column types of the dataset registry, long texts
+        # go to the lyrics store
+        from app.datasets import SCHEMAS, prepare
+        from app.lyrics_store import build
+
+        for csv_path in files:
+            path = convert(csv_path, prepare(csv_path))
+            print(f'{csv_path.name}: {csv_path.stat().st_size / 2**20:.1f} MB csv -> '
+                  f'{path.stat().st_size / 2**20:.1f} MB arrow')
+            texts = {col for schema in SCHEMAS.values() if schema.file == csv_path.name
+                     for col in schema.texts}
+            for column in sorted(texts):
+                path = build(csv_path, column)
+                print(f'{csv_path.name}: {column} -> {path.stat().st_size / 2**20:.1f} MB lyrics store')
+
+    else:
+        missing = [p.name for p in files if not arrow_path(p).exists()]
+        if missing:
+            parser.error(f'Convert these files first: {", ".join(missing)}')
+
+        results = measure_memory(files, args.workers)
+        print(f'{"mode":>6} {"worker":>7} {"rss MB":>8} {"uss MB":>8} {"pss MB":>8}')
+        for mode, workers in results.items():
+            for i, r in enumerate(workers):
+                print(f'{mode:>6} {i:>7} {r["rss_mb"]:>8.1f} {r["uss_mb"]:>8.1f} {r["pss_mb"]:>8.1f}')
+
+        # Average reduction of the memory every worker adds on its own
+        csv_uss = sum(r['uss_mb'] for r in results['csv']) / args.workers
+        arrow_uss = sum(r['uss_mb'] for r in results['arrow']) / args.workers
+        print(f'Unique memory per worker: {csv_uss:.1f} MB -> {arrow_uss:.1f} MB '
+              f'({csv_uss - arrow_uss:.1f} MB less)')
+
+
+if __name__ == '__main__':
+    main()
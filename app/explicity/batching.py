@@ -0,0 +1,270 @@
+# Imports
+import os
+import uuid
+import queue
+import logging
+import threading
+import time
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from app.explicity.config import MODEL_DIR
+from app.explicity.model import get_model, predict_batch, predict_windows
+
+logger = logging.getLogger(__name__)
+
+# Marker to stop the batching thread
+_STOP = object()
+
+
+def _warm_up(model_dir, backend):
+    # Load the model in the worker process before the first batch arrives
+    get_model(model_dir, backend=backend)
+
+
+class BatchingPredictor:
+    '''
+    Collects single predictions from concurrent callbacks into padded batches.
+
+    Requests wait in a bounded queue. A background thread flushes them as one
+    batch once max_batch_size requests are waiting or max_latency seconds have
+    passed since the first one, and hands every caller its own result through
+    a Future. With use_process=True the forward pass runs in a separate local
+    process, so torch compute does not hold the GIL of the Dash worker.
+
+    Requests can carry a key, for example a browser session. A new request
+    with the same key cancels the older one if it did not reach the model yet.
+    Without redis_url only requests of the same process replace each other.
+    With a redis_url the latest request of every key is also kept in redis,
+    and a request is dropped before the forward pass if a newer request of
+    its key reached another worker.
+    Requests for full lyrics (windowed=True) are batched together with the
+    windows of the other full lyrics requests.
+    '''
+
+    def __init__(self, model_dir=MODEL_DIR, max_batch_size=16, max_latency=0.02,
+                 max_queue_size=256, use_process=False, backend=None, redis_url=None,
+                 namespace='explicity:latest'):
+        self.model_dir = str(model_dir)
+        self.backend = backend
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+        self.use_process = use_process
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._latest = {}
+        self._latest_lock = threading.Lock()
+        self.namespace = namespace
+        self._redis = None
+        if redis_url:
+            import redis
+            self._redis = redis.Redis.from_url(redis_url)
+        self._executor = self._start_executor() if use_process else None
+        self._thread = threading.Thread(target=self._run, name='explicity-batcher',
+                                        daemon=True)
+        self._thread.start()
+
+    def _start_executor(self):
+        # Spawn instead of fork, torch does not survive a fork with live threads
+        return ProcessPoolExecutor(
+            max_workers=1,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_warm_up,
+            initargs=(self.model_dir, self.backend))
+
+    def submit(self, text, timeout=None, key=None, windowed=False):
+        '''
+        Queues lyrics for prediction.
+
+        Arguments:
+            text (str): The lyrics to classify.
+            timeout (float): Seconds to wait for a free queue slot. None blocks
+            until there is one.
+            key (str): Optional key of the caller. A pending request with the
+            same key is cancelled.
+            windowed (bool): Classify the full lyrics with sliding windows
+            instead of only the first 512 tokens.
+
+        Returns:
+            concurrent.futures.Future: Resolves to the prediction dict.
+
+        Raises:
+            queue.Full: If the queue stays full for the whole timeout.
+        '''
+        future = Future()
+        request_id = uuid.uuid4().hex
+        if key is not None:
+            self._supersede(key, future)
+            self._publish(key, request_id)
+        try:
+            self._queue.put((text, future, windowed, key, request_id), timeout=timeout)
+        except queue.Full:
+            future.cancel()
+            raise
+        return future
+
+    def predict(self, text, timeout=None, key=None, windowed=False):
+        '''
+        Queues lyrics and waits for their prediction.
+
+        Arguments:
+            text (str): The lyrics to classify.
+            timeout (float): Seconds to wait for a queue slot and the result
+            together. A request that times out is cancelled.
+            key (str): Optional key of the caller, see submit().
+            windowed (bool): Classify the full lyrics, see submit().
+
+        Returns:
+            dict: The predicted 'label' and 'probability' of the explicit class.
+
+        Raises:
+            concurrent.futures.CancelledError: If a newer request with the same
+            key replaced this one.
+            concurrent.futures.TimeoutError: If there is no result within the
+            timeout.
+        '''
+        # One deadline for the queue slot and the result
+        deadline = None if timeout is None else time.monotonic() + timeout
+        future = self.submit(text, timeout=timeout, key=key, windowed=windowed)
+        try:
+            return future.result(timeout=None if deadline is None
+                                 else max(deadline - time.monotonic(), 0))
+        except TimeoutError:
+            # Drop the request if it still waits in the queue, nobody reads it
+            future.cancel()
+            raise
+
+    def _supersede(self, key, future):
+        with self._latest_lock:
+            previous = self._latest.get(key)
+            self._latest[key] = future
+        if previous is not None:
+            # Only succeeds while the request still waits in the queue
+            previous.cancel()
+
+        # Forget the key once its latest request is done
+        def forget(done):
+            with self._latest_lock:
+                if self._latest.get(key) is done:
+                    del self._latest[key]
+        future.add_done_callback(forget)
+
+    def _publish(self, key, request_id):
+        # The latest request of the key for the batching threads of all workers
+        if self._redis is None:
+            return
+        try:
+            self._redis.set(f'{self.namespace}:{key}', request_id, ex=300)
+        except Exception:
+            logger.exception('Could not write the latest request to redis')
+
+    def _drop_superseded(self, batch):
+        # Cancel requests that a newer request of their key replaced in
+        # another worker
+        keyed = [request for request in batch if request[3] is not None]
+        if self._redis is None or not keyed:
+            return
+        try:
+            latest = self._redis.mget([f'{self.namespace}:{request[3]}' for request in keyed])
+        except Exception:
+            logger.exception('Could not read the latest requests from redis')
+            return
+        for request, request_id in zip(keyed, latest):
+            if request_id is not None and request_id.decode() != request[4]:
+                request[1].cancel()
+
+    def close(self):
+        self._queue.put(_STOP)
+        self._thread.join()
+        if self._executor is not None:
+            self._executor.shutdown()
+
+    def _collect(self):
+        # Block for the first request, then fill the batch until the deadline
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_latency
+        while batch[-1] is not _STOP and len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _predict(self, texts, windowed):
+        predict = predict_windows if windowed else predict_batch
+        if self._executor is None:
+            return predict(texts, self.model_dir, backend=self.backend)
+        try:
+            return self._executor.submit(predict, texts, self.model_dir,
+                                         backend=self.backend).result()
+        except BrokenProcessPool:
+            # The worker process died, start a new one for the next batch
+            self._executor = self._start_executor()
+            raise
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            stop = batch[-1] is _STOP
+            if stop:
+                batch.pop()
+
+            # Skip requests that were replaced or whose caller already
+            # cancelled them
+            self._drop_superseded(batch)
+            batch = [request for request in batch
+                     if request[1].set_running_or_notify_cancel()]
+
+            # Truncated and windowed requests run as separate forward passes
+            for windowed in (False, True):
+                requests = [(text, future) for text, future, w, _, _ in batch if w == windowed]
+                if not requests:
+                    continue
+                try:
+                    results = self._predict([text for text, _ in requests], windowed)
+                except Exception as e:
+                    for _, future in requests:
+                        future.set_exception(e)
+                else:
+                    for (_, future), result in zip(requests, results):
+                        future.set_result(result)
+
+            if stop:
+                return
+
+
+# One predictor per process, created lazily so every gunicorn worker gets its
+# own batching thread after the fork
+_predictor = None
+_predictor_pid = None
+_predictor_lock = threading.Lock()
+
+
+def get_predictor():
+    '''
+    Returns the batching predictor of the current process. Only requests of
+    the threads of one process are batched together, so the server runs
+    threaded gunicorn workers, see gunicorn.conf.py.
+
+    The batch size, latency deadline, queue size and process mode are read from
+    the EXPLICITY_MAX_BATCH_SIZE, EXPLICITY_MAX_LATENCY_MS,
+    EXPLICITY_MAX_QUEUE_SIZE and EXPLICITY_WORKER_PROCESS environment variables.
+    The latest request of every session is shared through the redis server of
+    EXPLICITY_CACHE_REDIS_URL if it is set.
+
+    Returns:
+        BatchingPredictor: The shared predictor.
+    '''
+    global _predictor, _predictor_pid
+    with _predictor_lock:
+        if _predictor is None or _predictor_pid != os.getpid():
+            _predictor = BatchingPredictor(
+                max_batch_size=int(os.environ.get('EXPLICITY_MAX_BATCH_SIZE', 16)),
+                max_latency=float(os.environ.get('EXPLICITY_MAX_LATENCY_MS', 20)) / 1000,
+                max_queue_size=int(os.environ.get('EXPLICITY_MAX_QUEUE_SIZE', 256)),
+                use_process=os.environ.get('EXPLICITY_WORKER_PROCESS') == '1',
+                redis_url=os.environ.get('EXPLICITY_CACHE_REDIS_URL'))
+            _predictor_pid = os.getpid()
+        return _predictor
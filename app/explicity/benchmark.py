@@ -0,0 +1,335 @@
+# Imports
+import json
+import time
+import argparse
+import platform
+import threading
+import statistics
+import multiprocessing
+from datetime import datetime, timezone
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import numpy as np
+import psutil
+import torch
+from app.explicity.config import BACKENDS, MODEL_DIR
+from app.explicity.model import MAX_LENGTH, get_model, predict_batch
+from app.explicity.batching import BatchingPredictor
+
+# Common lyric words, each is a single token for the roberta tokenizer
+_WORDS = ('baby', 'love', 'night', 'heart', 'dance', 'money', 'girl', 'feel', 'tonight', 'fire')
+
+# Fields that identify a measurement when comparing two runs
+CONFIG_FIELDS = ('mode', 'backend', 'threads', 'batch_size', 'tokens', 'concurrency')
+
+
+def synthetic_lyrics(num_tokens):
+    '''
+    Builds lyrics with about num_tokens tokens, including the special tokens.
+
+    Arguments:
+        num_tokens (int): The target length in tokens.
+
+    Returns:
+        str: The synthetic lyrics.
+    '''
+    return ' '.join(_WORDS[i % len(_WORDS)] for i in range(max(num_tokens - 2, 1)))
+
+
+def time_calls(fn, repeats, warmup=1):
+    '''
+    Measures the runtime of repeated calls after some warm up calls.
+
+    Arguments:
+        fn (callable): The function to measure.
+        repeats (int): Number of measured calls.
+        warmup (int): Number of unmeasured calls before.
+
+    Returns:
+        list of float: Runtime of every measured call in seconds.
+    '''
+    for _ in range(warmup):
+        fn()
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def time_call(fn, repeats):
+    # Median runtime in seconds
+    return statistics.median(time_calls(fn, repeats))
+
+
+class PeakRss:
+    '''
+    Context manager that samples the resident memory of this process while its
+    block runs, so every configuration of a sweep gets its own peak instead of
+    the peak of the whole process.
+
+    Spikes shorter than the sampling interval can be missed.
+
+    Attributes:
+        peak_mb (float): The highest sampled resident memory in MB.
+    '''
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak_mb = 0.0
+        self._process = psutil.Process()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self._sample()
+        self._thread = threading.Thread(target=self._run, name='rss-sampler', daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+        return False
+
+    def _sample(self):
+        self.peak_mb = max(self.peak_mb, self._process.memory_info().rss / 2**20)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+
+def latency_stats(timings, items_per_call=1):
+    '''
+    Summarizes call timings.
+
+    Arguments:
+        timings (list of float): Runtime of every call in seconds.
+        items_per_call (int): Lyrics predicted per call.
+
+    Returns:
+        dict: Median and 99th percentile latency in milliseconds and the
+        throughput in lyrics per second.
+    '''
+    timings = np.asarray(timings)
+    return {
+        'p50_ms': float(np.percentile(timings, 50) * 1000),
+        'p99_ms': float(np.percentile(timings, 99) * 1000),
+        'throughput': float(items_per_call * len(timings) / timings.sum()),
+    }
+
+
+def benchmark_padding(lengths, repeats=10):
+    '''
+    Compares single prediction latency of max_length and dynamic padding.
+
+    Arguments:
+        lengths (list of int): The input lengths in tokens to measure.
+        repeats (int): Number of measured calls per length and padding.
+
+    Returns:
+        list of dict: Per length the token count, the median latency in
+        seconds for both paddings and the speedup of dynamic padding.
+    '''
+    loaded = get_model()
+    rows = []
+    for length in lengths:
+        text = synthetic_lyrics(min(length, MAX_LENGTH))
+        row = {'tokens': len(loaded.encode(text, truncation=True,
+                                           max_length=MAX_LENGTH)['input_ids'])}
+        for padding in ('max_length', 'longest'):
+            row[padding] = time_call(lambda: predict_batch([text], padding=padding),
+                                     repeats)
+        row['speedup'] = row['max_length'] / row['longest']
+        rows.append(row)
+    return rows
+
+
+def _run_service(backend, concurrency, length, requests_per_client, model_dir):
+    # Concurrent clients send single lyrics through the batching predictor
+    predictor = BatchingPredictor(model_dir=model_dir, backend=backend)
+    text = synthetic_lyrics(length)
+    predictor.predict(text)
+
+    def client(_):
+        return time_calls(lambda: predictor.predict(text), requests_per_client, warmup=0)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        timings = [t for client_timings in pool.map(client, range(concurrency))
+                   for t in client_timings]
+    elapsed = time.perf_counter() - start
+    predictor.close()
+
+    stats = latency_stats(timings)
+    stats['throughput'] = len(timings) / elapsed
+    return stats
+
+
+def _run_backend(backend, threads, batch_sizes, lengths, concurrencies, repeats, model_dir):
+    # Runs in a fresh process, so the cold load belongs to one backend
+    torch.set_num_threads(threads)
+    start = time.perf_counter()
+    get_model(model_dir, backend=backend)
+    cold_load = time.perf_counter() - start
+
+    base = {'backend': backend, 'threads': threads, 'cold_load_s': cold_load}
+    records = []
+    for length in lengths:
+        texts = [synthetic_lyrics(length)]
+        for batch_size in batch_sizes:
+            with PeakRss() as rss:
+                timings = time_calls(lambda: predict_batch(texts * batch_size, model_dir,
+                                                           backend=backend), repeats)
+            records.append({**base, 'mode': 'batch', 'batch_size': batch_size,
+                            'tokens': length, 'concurrency': 1,
+                            **latency_stats(timings, batch_size),
+                            'config_peak_rss_mb': rss.peak_mb})
+
+        for concurrency in concurrencies:
+            with PeakRss() as rss:
+                stats = _run_service(backend, concurrency, length, repeats, model_dir)
+            records.append({**base, 'mode': 'service', 'batch_size': None,
+                            'tokens': length, 'concurrency': concurrency,
+                            **stats, 'config_peak_rss_mb': rss.peak_mb})
+    return records
+
+
+def benchmark_sweep(backends, threads_list, batch_sizes, lengths, concurrencies,
+                    repeats=20, model_dir=MODEL_DIR):
+    '''
+    Sweeps backends, thread counts, batch sizes and input lengths.
+
+    Every backend and thread count is measured in its own fresh process, which
+    gives the cold load time of one worker. The peak memory is sampled per
+    configuration, it includes the loaded model. In 'batch' mode predict_batch is called with batches of equal lyrics, in 'service'
+    mode concurrent clients send single lyrics through the BatchingPredictor.
+
+    Arguments:
+        backends (list of str): The backends to measure.
+        threads_list (list of int): The torch thread counts.
+        batch_sizes (list of int): Lyrics per predict_batch call.
+        lengths (list of int): Input lengths in tokens.
+        concurrencies (list of int): Concurrent clients of the service.
+        repeats (int): Measured calls per configuration and client.
+        model_dir (str or Path): Directory of the saved model and tokenizer.
+
+    Returns:
+        list of dict: One record per configuration with its p50 and p99
+        latency, throughput, cold load time and config_peak_rss_mb, the peak
+        resident memory while the configuration ran.
+    '''
+    context = multiprocessing.get_context('spawn')
+    records = []
+    for backend in backends:
+        for threads in threads_list:
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                records.extend(pool.submit(_run_backend, backend, threads, batch_sizes, lengths,
+                                           concurrencies, repeats, str(model_dir)).result())
+    return records
+
+
+def write_results(records, path, label=None):
+    '''
+    Appends benchmark records as json lines, together with the run metadata.
+    '''
+    run = {
+        'run': label or datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'torch': torch.__version__,
+        'machine': platform.machine(),
+        'cpu_count': multiprocessing.cpu_count(),
+    }
+    with open(path, 'a') as file:
+        for record in records:
+            file.write(json.dumps({**run, **record}) + '\n')
+
+
+def compare_results(base_path, new_path):
+    '''
+    Compares the latest run of two result files configuration by configuration.
+
+    Returns:
+        list of dict: Per configuration found in both files the median latency,
+        throughput and peak memory of both runs.
+    '''
+    def latest(path):
+        with open(path) as file:
+            records = [json.loads(line) for line in file if line.strip()]
+        last_run = records[-1]['run']
+        return {tuple(r[f] for f in CONFIG_FIELDS): r for r in records if r['run'] == last_run}
+
+    base, new = latest(base_path), latest(new_path)
+    return [{**dict(zip(CONFIG_FIELDS, key)),
+             'base_p50_ms': base[key]['p50_ms'], 'new_p50_ms': new[key]['p50_ms'],
+             'base_throughput': base[key]['throughput'], 'new_throughput': new[key]['throughput'],
+             'base_rss_mb': base[key].get('config_peak_rss_mb'),
+             'new_rss_mb': new[key].get('config_peak_rss_mb')}
+            for key in base if key in new]
+
+
+def _mb(value):
+    # Results written before the peak was sampled per configuration have none
+    return '-' if value is None else f'{value:.0f}'
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Latency, throughput and memory benchmarks of the explicity model.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    padding_parser = subparsers.add_parser(
+        'padding', help='Latency by input length, max_length vs dynamic padding.')
+    padding_parser.add_argument('--lengths', type=int, nargs='+',
+                                default=[16, 32, 64, 128, 256, 512])
+    padding_parser.add_argument('--repeats', type=int, default=10)
+
+    sweep_parser = subparsers.add_parser(
+        'sweep', help='Sweep backends, threads, batch sizes and lengths.')
+    sweep_parser.add_argument('--backends', nargs='+', choices=BACKENDS, default=['fp32'])
+    sweep_parser.add_argument('--threads', type=int, nargs='+', default=[1, 2, 4])
+    sweep_parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 4, 16])
+    sweep_parser.add_argument('--lengths', type=int, nargs='+', default=[64, 256, 512])
+    sweep_parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8])
+    sweep_parser.add_argument('--repeats', type=int, default=20)
+    sweep_parser.add_argument('--output', default='explicity_benchmark.jsonl')
+    sweep_parser.add_argument('--label', default=None, help='Name of the run in the results.')
+
+    compare_parser = subparsers.add_parser('compare', help='Compare two result files.')
+    compare_parser.add_argument('base')
+    compare_parser.add_argument('new')
+    args = parser.parse_args()
+
+    if args.command == 'padding':
+        print(f'{"tokens":>8} {"max_length (ms)":>16} {"longest (ms)":>14} {"speedup":>8}')
+        for row in benchmark_padding(args.lengths, args.repeats):
+            print(f'{row["tokens"]:>8} {row["max_length"] * 1000:>16.1f} '
+                  f'{row["longest"] * 1000:>14.1f} {row["speedup"]:>7.1f}x')
+
+    elif args.command == 'sweep':
+        records = benchmark_sweep(args.backends, args.threads, args.batch_sizes,
+                                  args.lengths, args.concurrency, args.repeats)
+        write_results(records, args.output, args.label)
+        print(f'{"mode":>8} {"backend":>8} {"threads":>8} {"batch":>6} {"tokens":>7} '
+              f'{"clients":>8} {"p50 ms":>8} {"p99 ms":>8} {"lyrics/s":>9} {"load s":>7} {"rss MB":>7}')
+        for r in records:
+            print(f'{r["mode"]:>8} {r["backend"]:>8} {r["threads"]:>8} {str(r["batch_size"] or "-"):>6} '
+                  f'{r["tokens"]:>7} {r["concurrency"]:>8} {r["p50_ms"]:>8.1f} {r["p99_ms"]:>8.1f} '
+                  f'{r["throughput"]:>9.1f} {r["cold_load_s"]:>7.1f} {r["config_peak_rss_mb"]:>7.0f}')
+        print(f'Results appended to {args.output}')
+
+    else:
+        print(f'{"mode":>8} {"backend":>8} {"threads":>8} {"batch":>6} {"tokens":>7} '
+              f'{"clients":>8} {"p50 ms":>15} {"lyrics/s":>17} {"rss MB":>13}')
+        for r in compare_results(args.base, args.new):
+            print(f'{r["mode"]:>8} {r["backend"]:>8} {r["threads"]:>8} {str(r["batch_size"] or "-"):>6} '
+                  f'{r["tokens"]:>7} {r["concurrency"]:>8} '
+                  f'{r["base_p50_ms"]:>7.1f}->{r["new_p50_ms"]:<7.1f} '
+                  f'{r["base_throughput"]:>8.1f}->{r["new_throughput"]:<8.1f} '
+                  f'{_mb(r["base_rss_mb"]):>6}->{_mb(r["new_rss_mb"]):<6}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+# Imports
+import json
+import time
+import argparse
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+import torch
+from app.datastore import atomic_write
+from app.datasets import file_hash
+from app.explicity.config import BACKENDS, LYRICS_PATH, PREDICTIONS_PATH, default_backend
+from app.explicity.model import MAX_LENGTH, get_model, length_buckets
+
+
+def _fingerprint(path):
+    # Size and modification time identify the input of an interrupted run
+    stat = Path(path).stat()
+    return {'path': str(path), 'size': stat.st_size, 'mtime': stat.st_mtime}
+
+
+def score_corpus(lyrics_path=LYRICS_PATH, output_path=PREDICTIONS_PATH, batch_size=32,
+                 chunk_size=1024, threads=None, backend=None):
+    '''
+    Scores every row of the lyrics data with the explicity model.
+
+    All lyrics are tokenized once and sorted by length, so every batch needs
+    little padding. The sorted rows are processed in chunks, each finished
+    chunk is written as a parquet part next to the output, and an interrupted
+    run continues with the first missing chunk. Padding of the next batch
+    runs in a helper thread while the model computes the current one.
+
+    Arguments:
+        lyrics_path (str or Path): The csv file with a 'lyrics' column.
+        output_path (str or Path): The parquet file to write.
+        batch_size (int): Lyrics per forward pass.
+        chunk_size (int): Lyrics per checkpoint.
+        threads (int): Torch intra-op threads, None keeps the torch default.
+        backend (str): One of BACKENDS, None for the configured default.
+
+    Returns:
+        pandas.DataFrame: Per row of the input the 'explicit_prediction' and
+        the 'explicit_probability'. Its attrs hold the 'input_sha256' of the
+        lyrics file, which is also stored in the parquet file.
+    '''
+    if threads:
+        torch.set_num_threads(threads)
+
+    # The backend the model is loaded with, so a run never resumes the parts
+    # of another backend
+    backend = backend or default_backend()
+
+    output_path = Path(output_path)
+    parts_dir = output_path.with_suffix('.parts')
+    parts_dir.mkdir(parents=True, exist_ok=True)
+
+    # Start over if the input or the chunking changed since the last run
+    plan = {'input': _fingerprint(lyrics_path), 'chunk_size': chunk_size, 'backend': backend}
+    plan_path = parts_dir / 'plan.json'
+    if not plan_path.exists() or json.loads(plan_path.read_text()) != plan:
+        for part in parts_dir.glob('part-*.parquet'):
+            part.unlink()
+        plan_path.write_text(json.dumps(plan))
+
+    lyrics = pd.read_csv(lyrics_path, usecols=['lyrics'])['lyrics'].fillna('').astype(str)
+    loaded = get_model(backend=backend)
+    encodings = loaded.encode(lyrics.tolist(), truncation=True, max_length=MAX_LENGTH)
+    chunks = length_buckets(encodings['input_ids'], chunk_size)
+
+    def pad(rows):
+        features = {key: [encodings[key][i] for i in rows] for key in encodings}
+        return loaded.pad(features, padding='longest')
+
+    start = time.perf_counter()
+    scored = 0
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        for number, chunk in enumerate(chunks):
+            part_path = parts_dir / f'part-{number:05d}.parquet'
+            if part_path.exists():
+                continue
+
+            batches = [chunk[i:i + batch_size] for i in range(0, len(chunk), batch_size)]
+            pending = pool.submit(pad, batches[0])
+            probabilities = []
+            for i in range(len(batches)):
+                inputs = pending.result()
+                if i + 1 < len(batches):
+                    pending = pool.submit(pad, batches[i + 1])
+                probabilities.append(loaded.logits(inputs).softmax(dim=-1)[:, 1])
+
+            probability = torch.cat(probabilities).numpy()
+            part = pd.DataFrame({'row': chunk,
+                                 'explicit_prediction': probability >= 0.5,
+                                 'explicit_probability': probability.astype('float32')})
+
+            # A crash never leaves half a part
+            with atomic_write(part_path) as tmp_path:
+                part.to_parquet(tmp_path, index=False)
+
+            scored += len(chunk)
+            elapsed = time.perf_counter() - start
+            print(f'Chunk {number + 1}/{len(chunks)}: {scored / elapsed:.1f} rows/sec')
+
+    predictions = pd.concat([pd.read_parquet(part) for part in sorted(parts_dir.glob('part-*.parquet'))])
+    predictions = predictions.set_index('row').sort_index()
+    predictions.index.name = None
+
+    # The rows are rows of this version of the lyrics file, readers compare
+    # the hash before pairing them with their songs
+    predictions.attrs['input_sha256'] = file_hash(lyrics_path)
+    with atomic_write(output_path) as tmp_path:
+        predictions.to_parquet(tmp_path)
+    return predictions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Score every lyric of the charts data with the explicity model.')
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--chunk-size', type=int, default=1024)
+    parser.add_argument('--threads', type=int, default=None,
+                        help='Torch intra-op threads, defaults to the torch default.')
+    parser.add_argument('--backend', choices=BACKENDS, default=None)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    predictions = score_corpus(batch_size=args.batch_size, chunk_size=args.chunk_size,
+                               threads=args.threads, backend=args.backend)
+    elapsed = time.perf_counter() - start
+    print(f'Scored {len(predictions)} rows in {elapsed:.1f}s '
+          f'with {torch.get_num_threads()} threads, written to {PREDICTIONS_PATH}')
+
+
+if __name__ == '__main__':
+    main()
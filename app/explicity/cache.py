@@ -0,0 +1,148 @@
+# Imports
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_lyrics(text):
+    # Lyrics that only differ in whitespace or case share one cache entry
+    return ' '.join(text.split()).lower()
+
+
+def prediction_key(text, backend, mode='truncated'):
+    '''
+    Builds the content address of lyrics for a backend and prediction mode.
+
+    Arguments:
+        text (str): The lyrics.
+        backend (str): The inference backend, backends may differ in their
+        results.
+        mode (str): 'truncated' or 'windowed' prediction.
+
+    Returns:
+        str: Hex sha256 of the backend, mode and the normalized lyrics.
+    '''
+    return hashlib.sha256(f'{backend}\0{mode}\0{normalize_lyrics(text)}'.encode()).hexdigest()
+
+
+class PredictionCache:
+    '''
+    In-process LRU cache with a time to live for prediction results.
+
+    With a redis_url the entries are also written to redis, so every gunicorn
+    worker can answer lyrics another worker already predicted. Redis errors
+    are logged and the cache falls back to the local entries.
+    '''
+
+    def __init__(self, max_size=4096, ttl=3600, redis_url=None, namespace='explicity:prediction'):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.namespace = namespace
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._redis = None
+        if redis_url:
+            import redis
+            self._redis = redis.Redis.from_url(redis_url)
+
+    def get(self, key):
+        '''
+        Returns the cached result for a key or None on a miss.
+        '''
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires, value = entry
+                if expires > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+
+        value = self._shared_get(key)
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.shared_hits += 1
+            self._store(key, value, now)
+        return value
+
+    def set(self, key, value):
+        '''
+        Stores a json serializable result under a key.
+        '''
+        with self._lock:
+            self._store(key, value, time.monotonic())
+        if self._redis is not None:
+            try:
+                self._redis.set(f'{self.namespace}:{key}', json.dumps(value), ex=self.ttl)
+            except Exception:
+                logger.exception('Could not write the prediction to redis')
+
+    def stats(self):
+        '''
+        Returns the hit and miss counters of this process.
+        '''
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'shared_hits': self.shared_hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'size': len(self._entries),
+            }
+
+    def _store(self, key, value, now):
+        # Caller holds the lock
+        self._entries[key] = (now + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def _shared_get(self, key):
+        if self._redis is None:
+            return None
+        try:
+            raw = self._redis.get(f'{self.namespace}:{key}')
+        except Exception:
+            logger.exception('Could not read the prediction from redis')
+            return None
+        return json.loads(raw) if raw is not None else None
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_prediction_cache():
+    '''
+    Returns the prediction cache of the current process.
+
+    The size, time to live in seconds and the optional shared redis backend are
+    read from the EXPLICITY_CACHE_SIZE, EXPLICITY_CACHE_TTL and
+    EXPLICITY_CACHE_REDIS_URL environment variables.
+
+    Returns:
+        PredictionCache: The shared cache.
+    '''
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = PredictionCache(
+                max_size=int(os.environ.get('EXPLICITY_CACHE_SIZE', 4096)),
+                ttl=int(os.environ.get('EXPLICITY_CACHE_TTL', 3600)),
+                redis_url=os.environ.get('EXPLICITY_CACHE_REDIS_URL'))
+        return _cache
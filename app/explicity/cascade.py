@@ -0,0 +1,218 @@
+# Imports
+import argparse
+import threading
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfTransformer
+from sklearn.linear_model import LogisticRegression
+from sklearn.model_selection import train_test_split
+from sklearn.pipeline import make_pipeline
+from app.explicity.config import LYRICS_PATH, MODEL_DIR
+from app.explicity.model import LABELS, predict_batch
+
+# Location of the trained lexical classifier and its threshold
+LEXICAL_MODEL_PATH = MODEL_DIR / 'lexical.joblib'
+
+
+def build_pipeline(n_features=2**20):
+    '''
+    Builds the lexical classifier: hashed word uni- and bigrams, tf-idf
+    weighting and a logistic regression.
+
+    Arguments:
+        n_features (int): Number of hash buckets.
+
+    Returns:
+        sklearn.pipeline.Pipeline: The untrained classifier.
+    '''
+    return make_pipeline(
+        HashingVectorizer(ngram_range=(1, 2), n_features=n_features,
+                          alternate_sign=False, norm=None),
+        TfidfTransformer(sublinear_tf=True),
+        LogisticRegression(max_iter=1000, C=4.0))
+
+
+def cascade_report(labels, lexical_probabilities, transformer_predictions, thresholds):
+    '''
+    Evaluates the cascade for a range of confidence thresholds.
+
+    Lyrics whose lexical confidence max(p, 1 - p) reaches the threshold are
+    answered by the lexical classifier, the others by the transformer.
+
+    Arguments:
+        labels (numpy.ndarray): The true explicit labels (0 or 1).
+        lexical_probabilities (numpy.ndarray): Explicit probability of the
+        lexical classifier.
+        transformer_predictions (numpy.ndarray): Labels of the transformer.
+        thresholds (list of float): The thresholds to evaluate.
+
+    Returns:
+        pandas.DataFrame: Per threshold the cascade accuracy, the accuracy on
+        the lexically answered lyrics and the fraction escalated to the
+        transformer.
+    '''
+    lexical_predictions = (lexical_probabilities >= 0.5).astype(int)
+    confidence = np.maximum(lexical_probabilities, 1 - lexical_probabilities)
+
+    rows = []
+    for threshold in thresholds:
+        answered = confidence >= threshold
+        predictions = np.where(answered, lexical_predictions, transformer_predictions)
+        rows.append({
+            'threshold': threshold,
+            'accuracy': (predictions == labels).mean(),
+            'lexical_accuracy': (lexical_predictions[answered] == labels[answered]).mean()
+                                if answered.any() else np.nan,
+            'escalated': 1 - answered.mean(),
+        })
+    return pd.DataFrame(rows)
+
+
+def choose_threshold(report, transformer_accuracy, tolerance=0.005):
+    '''
+    Picks the threshold that escalates the fewest lyrics while the cascade
+    stays within tolerance of the transformer accuracy.
+
+    Arguments:
+        report (pandas.DataFrame): Output of cascade_report.
+        transformer_accuracy (float): Accuracy of the transformer alone.
+        tolerance (float): Allowed loss of accuracy.
+
+    Returns:
+        float: The chosen threshold, inf (always escalate) if none qualifies.
+    '''
+    qualified = report[report['accuracy'] >= transformer_accuracy - tolerance]
+    if qualified.empty:
+        return float('inf')
+    return float(qualified.sort_values(['escalated', 'threshold']).iloc[0]['threshold'])
+
+
+def train(tolerance=0.005, seed=42, batch_size=16):
+    '''
+    Trains the lexical classifier, tunes its threshold against the
+    transformer on a validation split and reports on a test split.
+
+    Arguments:
+        tolerance (float): Allowed loss of accuracy against the transformer.
+        seed (int): Seed of the train/validation/test split.
+        batch_size (int): Length bucket size for the transformer predictions.
+
+    Returns:
+        tuple: The trained pipeline, the threshold and the test report.
+    '''
+    df = pd.read_csv(LYRICS_PATH, usecols=['lyrics', 'explicit']).dropna()
+    texts = df['lyrics'].astype(str).to_numpy()
+    labels = df['explicit'].astype(bool).astype(int).to_numpy()
+
+    # 60% train, 20% threshold tuning, 20% test
+    train_texts, rest_texts, train_labels, rest_labels = train_test_split(
+        texts, labels, test_size=0.4, stratify=labels, random_state=seed)
+    val_texts, test_texts, val_labels, test_labels = train_test_split(
+        rest_texts, rest_labels, test_size=0.5, stratify=rest_labels, random_state=seed)
+
+    pipeline = build_pipeline()
+    pipeline.fit(train_texts, train_labels)
+
+    def transformer_labels(texts):
+        results = predict_batch(texts, batch_size=batch_size)
+        return np.array([LABELS.index(result['label']) for result in results])
+
+    thresholds = np.round(np.arange(0.5, 1.0, 0.025), 3)
+
+    # Tune the threshold on the validation split
+    val_transformer = transformer_labels(val_texts)
+    val_report = cascade_report(val_labels, pipeline.predict_proba(val_texts)[:, 1],
+                                val_transformer, thresholds)
+    threshold = choose_threshold(val_report, (val_transformer == val_labels).mean(), tolerance)
+
+    # Report the chosen threshold on unseen lyrics
+    test_transformer = transformer_labels(test_texts)
+    test_report = cascade_report(test_labels, pipeline.predict_proba(test_texts)[:, 1],
+                                 test_transformer, thresholds)
+    test_report.attrs['transformer_accuracy'] = (test_transformer == test_labels).mean()
+
+    return pipeline, threshold, test_report
+
+
+class LexicalCascade:
+    '''
+    First stage of the explicity prediction. Answers lyrics the lexical
+    classifier is confident about and leaves the rest to the transformer.
+    '''
+
+    def __init__(self, pipeline, threshold):
+        self.pipeline = pipeline
+        self.threshold = threshold
+
+    def predict(self, text):
+        '''
+        Predicts lyrics if the lexical classifier is confident enough.
+
+        Arguments:
+            text (str): The lyrics to classify.
+
+        Returns:
+            dict: The predicted 'label', 'probability' of the explicit class
+            and 'stage', or None if the lyrics need the transformer.
+        '''
+        probability = float(self.pipeline.predict_proba([text])[0, 1])
+        if max(probability, 1 - probability) < self.threshold:
+            return None
+        return {'label': LABELS[int(probability >= 0.5)], 'probability': probability,
+                'stage': 'lexical'}
+
+
+_cascade = None
+_cascade_loaded = False
+_cascade_lock = threading.Lock()
+
+
+def get_cascade():
+    '''
+    Returns the lexical first stage, loaded on first use.
+
+    Returns:
+        LexicalCascade: The first stage, or None if no lexical classifier was
+        trained yet or no threshold kept the accuracy.
+    '''
+    global _cascade, _cascade_loaded
+    with _cascade_lock:
+        if not _cascade_loaded:
+            if LEXICAL_MODEL_PATH.exists():
+                saved = joblib.load(LEXICAL_MODEL_PATH)
+                # A saturated logistic regression is fully confident, only a
+                # threshold below 1.0 leaves some lyrics to the lexical stage
+                # (older files stored 1.0 for always escalate)
+                if saved['threshold'] < 1.0:
+                    _cascade = LexicalCascade(saved['pipeline'], saved['threshold'])
+            _cascade_loaded = True
+        return _cascade
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Train the lexical first stage of the explicity prediction.')
+    parser.add_argument('--tolerance', type=float, default=0.005,
+                        help='Allowed loss of accuracy against the transformer.')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--batch-size', type=int, default=16)
+    args = parser.parse_args()
+
+    pipeline, threshold, report = train(args.tolerance, args.seed, args.batch_size)
+    joblib.dump({'pipeline': pipeline, 'threshold': threshold}, LEXICAL_MODEL_PATH)
+
+    print(f'Transformer accuracy on the test split: {report.attrs["transformer_accuracy"]:.2%}')
+    print(report.to_string(index=False, float_format=lambda x: f'{x:.3f}'))
+    chosen = report[report['threshold'] == threshold]
+    if not chosen.empty:
+        chosen = chosen.iloc[0]
+        print(f'Chosen threshold {threshold}: accuracy {chosen["accuracy"]:.2%}, '
+              f'{chosen["escalated"]:.1%} escalated to the transformer')
+    else:
+        print('No threshold kept the accuracy, every lyric is escalated to the transformer')
+    print(f'Saved the lexical classifier to {LEXICAL_MODEL_PATH}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,30 @@
+# Imports
+import os
+from pathlib import Path
+
+# Paths and settings of the explicity prediction. This module only needs the
+# standard library, so pages can use it without importing torch.
+
+# Directory of the fine-tuned roberta model
+MODEL_DIR = Path(__file__).resolve().parents[2] / 'data' / 'trained_model_explicity'
+
+# Location of the exported onnx graph inside the model directory
+ONNX_FILE = Path('onnx') / 'model.onnx'
+
+# Lyrics of the charts with their Spotify explicit label
+LYRICS_PATH = Path(__file__).resolve().parents[2] / 'data' / 'final_data' / 'all_locations_with_polarity_and_spotify_without_duplicates.csv'
+
+# Model predictions for every row of the lyrics data
+PREDICTIONS_PATH = LYRICS_PATH.parent / 'explicity_predictions.parquet'
+
+# Available inference backends: the original fp32 torch model, torch dynamic
+# int8 quantization and the exported onnx runtime graph
+BACKENDS = ('fp32', 'int8', 'onnx')
+
+
+def default_backend():
+    # The backend is selected per deployment with EXPLICITY_BACKEND
+    backend = os.environ.get('EXPLICITY_BACKEND', 'fp32')
+    if backend not in BACKENDS:
+        raise ValueError(f'Unknown explicity backend "{backend}", choose one of {BACKENDS}.')
+    return backend
@@ -0,0 +1,156 @@
+# Imports
+import argparse
+import sys
+import time
+from pathlib import Path
+import pandas as pd
+import psutil
+import torch
+from app.explicity.config import BACKENDS, LYRICS_PATH, MODEL_DIR, ONNX_FILE
+from app.explicity.model import MAX_LENGTH, get_model
+
+
+class _LogitsOnly(torch.nn.Module):
+    # The onnx graph only needs the logits, not the whole model output object
+    def __init__(self, model):
+        super().__init__()
+        self.model = model
+
+    def forward(self, input_ids, attention_mask):
+        return self.model(input_ids=input_ids, attention_mask=attention_mask).logits
+
+
+def export_onnx(model_dir=MODEL_DIR, opset=17):
+    '''
+    Exports the fp32 model to an onnx graph with dynamic batch and sequence size.
+
+    Arguments:
+        model_dir (str or Path): Directory of the saved model and tokenizer.
+        opset (int): The onnx opset version.
+
+    Returns:
+        Path: Location of the written graph.
+    '''
+    loaded = get_model(model_dir, backend='fp32')
+    path = Path(model_dir) / ONNX_FILE
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    example = loaded.tokenize(['Example lyrics to trace the model'], padding='longest',
+                              truncation=True, max_length=MAX_LENGTH)
+    torch.onnx.export(
+        _LogitsOnly(loaded.model),
+        (example['input_ids'], example['attention_mask']),
+        str(path),
+        input_names=['input_ids', 'attention_mask'],
+        output_names=['logits'],
+        dynamic_axes={'input_ids': {0: 'batch', 1: 'sequence'},
+                      'attention_mask': {0: 'batch', 1: 'sequence'},
+                      'logits': {0: 'batch'}},
+        opset_version=opset)
+    return path
+
+
+def load_lyrics_sample(num_samples, seed=42):
+    '''
+    Draws a fixed random sample of lyrics from the charts data.
+
+    Arguments:
+        num_samples (int): Number of lyrics to draw.
+        seed (int): Seed of the sample, so every run compares the same texts.
+
+    Returns:
+        list of str: The sampled lyrics.
+    '''
+    lyrics = pd.read_csv(LYRICS_PATH, usecols=['lyrics'])['lyrics'].dropna().astype(str)
+    return lyrics.sample(n=min(num_samples, len(lyrics)), random_state=seed).tolist()
+
+
+def _logits(loaded, texts, batch_size):
+    logits = []
+    for i in range(0, len(texts), batch_size):
+        inputs = loaded.tokenize(texts[i:i + batch_size], padding='longest',
+                                 truncation=True, max_length=MAX_LENGTH)
+        logits.append(loaded.logits(inputs))
+    return torch.cat(logits)
+
+
+def parity_check(texts, backends=BACKENDS, model_dir=MODEL_DIR, batch_size=1):
+    '''
+    Compares the logits of every backend against the fp32 torch model.
+
+    Arguments:
+        texts (list of str): The lyrics to compare on.
+        backends (tuple of str): The backends to check.
+        model_dir (str or Path): Directory of the saved model and tokenizer.
+        batch_size (int): Lyrics per forward pass, 1 measures per request
+        latency.
+
+    Returns:
+        list of dict: Per backend the memory growth of loading it, the seconds
+        per text, the maximum and mean absolute logit difference and the share
+        of equal labels.
+    '''
+    process = psutil.Process()
+    reference = None
+    rows = []
+    for backend in ('fp32',) + tuple(b for b in backends if b != 'fp32'):
+        rss = process.memory_info().rss
+        loaded = get_model(model_dir, backend=backend)
+        load_rss = process.memory_info().rss - rss
+
+        start = time.perf_counter()
+        logits = _logits(loaded, texts, batch_size)
+        seconds = (time.perf_counter() - start) / len(texts)
+
+        if reference is None:
+            reference = logits
+        diff = (logits - reference).abs()
+        if backend in backends:
+            rows.append({
+                'backend': backend,
+                'load_rss_mb': load_rss / 2**20,
+                'ms_per_text': seconds * 1000,
+                'max_abs_diff': float(diff.max()),
+                'mean_abs_diff': float(diff.mean()),
+                'label_agreement': float((logits.argmax(dim=-1) == reference.argmax(dim=-1)).float().mean()),
+            })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Export the explicity model to onnx and check backend parity.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    export_parser = subparsers.add_parser('export', help='Export the onnx graph.')
+    export_parser.add_argument('--opset', type=int, default=17)
+
+    check_parser = subparsers.add_parser('check', help='Compare backend logits.')
+    check_parser.add_argument('--samples', type=int, default=200)
+    check_parser.add_argument('--seed', type=int, default=42)
+    check_parser.add_argument('--batch-size', type=int, default=1)
+    check_parser.add_argument('--backends', nargs='+', choices=BACKENDS, default=list(BACKENDS))
+    check_parser.add_argument('--min-agreement', type=float, default=0.99,
+                              help='Exit with an error below this label agreement.')
+    args = parser.parse_args()
+
+    if args.command == 'export':
+        print(f'Exported onnx graph to {export_onnx(opset=args.opset)}')
+        return
+
+    texts = load_lyrics_sample(args.samples, args.seed)
+    rows = parity_check(texts, tuple(args.backends), batch_size=args.batch_size)
+
+    print(f'{"backend":>8} {"load (MB)":>10} {"ms/text":>9} {"max diff":>9} '
+          f'{"mean diff":>10} {"agreement":>10}')
+    for row in rows:
+        print(f'{row["backend"]:>8} {row["load_rss_mb"]:>10.0f} {row["ms_per_text"]:>9.1f} '
+              f'{row["max_abs_diff"]:>9.4f} {row["mean_abs_diff"]:>10.4f} '
+              f'{row["label_agreement"]:>10.2%}')
+
+    if any(row['label_agreement'] < args.min_agreement for row in rows):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
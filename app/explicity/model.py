@@ -0,0 +1,256 @@
+# Imports
+import threading
+from pathlib import Path
+import torch
+from transformers import AutoModelForSequenceClassification, AutoTokenizer
+from app.explicity.config import MODEL_DIR, ONNX_FILE, default_backend
+
+# Maximum number of tokens the model accepts
+MAX_LENGTH = 512
+
+# Process wide registry of loaded models, keyed by model directory, labels and
+# backend
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+class LoadedModel:
+    '''
+    Tokenizer and model loaded once per process and shared by all callbacks.
+
+    The fast tokenizer changes its internal padding/truncation state on every
+    call, so tokenization is guarded by a lock. The forward pass runs in
+    inference mode on a model in eval mode and is safe to call from several
+    threads at once. The onnx backend keeps no torch model in memory at all.
+    '''
+
+    def __init__(self, model_dir, num_labels=2, backend='fp32'):
+        self.model_dir = Path(model_dir)
+        self.backend = backend
+        self.tokenizer = AutoTokenizer.from_pretrained(self.model_dir)
+        self._tokenizer_lock = threading.Lock()
+        self.model = None
+        self.session = None
+
+        if backend == 'onnx':
+            self.session = _onnx_session(self.model_dir / ONNX_FILE)
+            return
+
+        self.model = AutoModelForSequenceClassification.from_pretrained(
+            self.model_dir, num_labels=num_labels)
+        self.model.eval()
+        if backend == 'int8':
+            # Replace the linear layers in place, so no fp32 copy stays around
+            torch.ao.quantization.quantize_dynamic(
+                self.model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+
+    def tokenize(self, texts, **kwargs):
+        with self._tokenizer_lock:
+            return self.tokenizer(texts, return_tensors='pt', **kwargs)
+
+    def encode(self, texts, **kwargs):
+        # Token ids as python lists, to be padded later with pad()
+        with self._tokenizer_lock:
+            return self.tokenizer(texts, **kwargs)
+
+    def pad(self, features, **kwargs):
+        with self._tokenizer_lock:
+            return self.tokenizer.pad(features, return_tensors='pt', **kwargs)
+
+    def logits(self, inputs):
+        if self.session is not None:
+            feeds = {name: inputs[name].numpy()
+                     for name in ('input_ids', 'attention_mask')}
+            return torch.from_numpy(self.session.run(['logits'], feeds)[0])
+        with torch.inference_mode():
+            return self.model(**inputs).logits
+
+
+def _onnx_session(path):
+    # onnxruntime is only needed for the onnx backend
+    try:
+        import onnxruntime
+    except ImportError as e:
+        raise ImportError('The onnx backend needs onnxruntime, install it with '
+                          'pip install onnxruntime.') from e
+
+    if not path.exists():
+        raise FileNotFoundError(f'No onnx graph at {path}, export it first with '
+                                'python -m app.explicity.convert export.')
+
+    options = onnxruntime.SessionOptions()
+    options.intra_op_num_threads = torch.get_num_threads()
+    return onnxruntime.InferenceSession(str(path), options,
+                                        providers=['CPUExecutionProvider'])
+
+
+def get_model(model_dir=MODEL_DIR, num_labels=2, backend=None):
+    '''
+    Returns the shared model for a directory, loading it on first use.
+
+    Arguments:
+        model_dir (str or Path): Directory of the saved model and tokenizer.
+        num_labels (int): Number of output labels of the classifier.
+        backend (str): One of BACKENDS. None uses the EXPLICITY_BACKEND
+        environment variable, defaulting to 'fp32'.
+
+    Returns:
+        LoadedModel: The tokenizer and model in eval mode.
+    '''
+    backend = backend or default_backend()
+    key = (str(Path(model_dir).resolve()), num_labels, backend)
+
+    # Fast path without locking once the model is loaded
+    loaded = _registry.get(key)
+    if loaded is not None:
+        return loaded
+
+    # Only one thread loads the model, the others wait and reuse it
+    with _registry_lock:
+        loaded = _registry.get(key)
+        if loaded is None:
+            loaded = LoadedModel(model_dir, num_labels=num_labels, backend=backend)
+            _registry[key] = loaded
+    return loaded
+
+
+# Names of the classifier labels by index
+LABELS = ('Not Explicit', 'Explicit')
+
+
+def length_buckets(input_ids, batch_size):
+    '''
+    Groups sequences of similar length so every batch needs little padding.
+
+    Arguments:
+        input_ids (list of list of int): The unpadded token ids per text.
+        batch_size (int): Maximum number of sequences per bucket.
+
+    Returns:
+        list of list of int: Indices into input_ids, sorted by length and
+        split into buckets of at most batch_size.
+    '''
+    order = sorted(range(len(input_ids)), key=lambda i: len(input_ids[i]))
+    return [order[i:i + batch_size] for i in range(0, len(order), batch_size)]
+
+
+def _to_results(logits):
+    probabilities = logits.softmax(dim=-1)
+    return [{'label': LABELS[int(row.argmax())], 'probability': float(row[1])}
+            for row in probabilities]
+
+
+def predict_batch(texts, model_dir=MODEL_DIR, num_labels=2, padding='longest',
+                  batch_size=None, backend=None):
+    '''
+    Predicts the explicity label for several lyrics.
+
+    By default all texts run as one forward pass, padded only to the longest
+    text of the batch. With a batch_size (batch/offline mode) the texts are
+    sorted into length buckets of that size, each bucket runs as its own
+    forward pass and the results come back in the original order.
+
+    Arguments:
+        texts (list of str): The lyrics to classify.
+        model_dir (str or Path): Directory of the saved model and tokenizer.
+        num_labels (int): Number of output labels of the classifier.
+        padding (str): 'longest' to pad to the longest text of a batch or
+        'max_length' to pad every text to 512 tokens.
+        batch_size (int): Bucket size for length bucketing. None runs a single
+        batch.
+        backend (str): One of BACKENDS, None for the configured default.
+
+    Returns:
+        list of dict: One result per text with the predicted 'label' and the
+        'probability' of the explicit class.
+    '''
+    loaded = get_model(model_dir, num_labels=num_labels, backend=backend)
+    texts = list(texts)
+
+    # Tokenize all lyrics as one padded batch
+    if batch_size is None:
+        inputs = loaded.tokenize(texts, padding=padding, truncation=True,
+                                 max_length=MAX_LENGTH)
+        return _to_results(loaded.logits(inputs))
+
+    # Tokenize once without padding, then pad every length bucket on its own
+    encodings = loaded.encode(texts, truncation=True, max_length=MAX_LENGTH)
+    results = [None] * len(texts)
+    for bucket in length_buckets(encodings['input_ids'], batch_size):
+        features = {key: [encodings[key][i] for i in bucket] for key in encodings}
+        inputs = loaded.pad(features, padding=padding, max_length=MAX_LENGTH)
+        for i, result in zip(bucket, _to_results(loaded.logits(inputs))):
+            results[i] = result
+    return results
+
+
+def predict_windows(texts, model_dir=MODEL_DIR, num_labels=2, overlap=128,
+                    aggregate='max', backend=None):
+    '''
+    Predicts the explicity label of full lyrics with overlapping windows.
+
+    Lyrics longer than 512 tokens are split into overlapping windows. The
+    windows of all texts run as one padded batch and the logits of each text
+    are aggregated over its windows, either the maximum or the mean per class.
+    The deciding window is the one with the largest margin for the verdict.
+
+    Arguments:
+        texts (list of str): The lyrics to classify.
+        model_dir (str or Path): Directory of the saved model and tokenizer.
+        num_labels (int): Number of output labels of the classifier.
+        overlap (int): Number of tokens shared by neighbouring windows.
+        aggregate (str): 'max' or 'mean' of the window logits.
+        backend (str): One of BACKENDS, None for the configured default.
+
+    Returns:
+        list of dict: One result per text with the predicted 'label', the
+        'probability' of the explicit class, the index of the deciding
+        'window', the number of 'windows', the character 'span' of the
+        deciding window in the lyrics and its text as 'excerpt'.
+    '''
+    if aggregate not in ('max', 'mean'):
+        raise ValueError(f'Unknown aggregation "{aggregate}", use "max" or "mean".')
+
+    loaded = get_model(model_dir, num_labels=num_labels, backend=backend)
+    texts = list(texts)
+
+    # Tokenize every text into overlapping windows, all windows form one batch
+    inputs = loaded.tokenize(texts, padding='longest', truncation=True,
+                             max_length=MAX_LENGTH, stride=overlap,
+                             return_overflowing_tokens=True,
+                             return_offsets_mapping=True)
+    sample_mapping = inputs.pop('overflow_to_sample_mapping')
+    offsets = inputs.pop('offset_mapping')
+    logits = loaded.logits(inputs)
+
+    results = []
+    for i in range(len(texts)):
+        rows = (sample_mapping == i).nonzero().flatten()
+        window_logits = logits[rows]
+        if aggregate == 'max':
+            aggregated = window_logits.max(dim=0).values
+        else:
+            aggregated = window_logits.mean(dim=0)
+        label = int(aggregated.argmax())
+
+        # Window with the largest margin between the verdict and the other classes
+        others = torch.cat([window_logits[:, :label], window_logits[:, label + 1:]], dim=1)
+        margins = window_logits[:, label] - others.max(dim=1).values
+        window = int(margins.argmax())
+
+        # Character span of the deciding window, special tokens have empty offsets
+        window_offsets = offsets[rows[window]]
+        window_offsets = window_offsets[window_offsets[:, 1] > 0]
+        start, end = 0, 0
+        if len(window_offsets):
+            start, end = int(window_offsets[:, 0].min()), int(window_offsets[:, 1].max())
+
+        results.append({
+            'label': LABELS[label],
+            'probability': float(aggregated.softmax(dim=-1)[1]),
+            'window': window,
+            'windows': len(rows),
+            'span': [start, end],
+            'excerpt': texts[i][start:end],
+        })
+    return results
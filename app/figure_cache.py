@@ -0,0 +1,210 @@
+# Imports
+import os
+import json
+import time
+import hashlib
+import logging
+import tempfile
+import threading
+import functools
+from collections import OrderedDict
+from plotly.basedatatypes import BaseFigure
+from flask_caching import Cache
+from flask_caching.backends.base import BaseCache
+from app.app import app
+from app.datasets import data_version
+
+logger = logging.getLogger(__name__)
+
+
+class LRUCache(BaseCache):
+    '''
+    In-process cache that drops the least recently used figure once it holds
+    threshold figures. Figures are kept as objects, without pickling.
+    '''
+
+    def __init__(self, threshold=256, default_timeout=300, **kwargs):
+        super().__init__(default_timeout)
+        self.threshold = threshold
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def factory(cls, app, config, args, kwargs):
+        kwargs.update(threshold=config['CACHE_THRESHOLD'])
+        return cls(*args, **kwargs)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires and expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout=None):
+        timeout = self._normalize_timeout(timeout)
+        expires = time.monotonic() + timeout if timeout else 0
+        with self._lock:
+            self._entries[key] = (expires, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.threshold:
+                self._entries.popitem(last=False)
+        return True
+
+    def delete(self, key):
+        with self._lock:
+            return self._entries.pop(key, None) is not None
+
+    def has(self, key):
+        return self.get(key) is not None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        return True
+
+
+# Backends selectable with FIGURE_CACHE_TYPE
+CACHE_TYPES = {
+    'lru': 'app.figure_cache.LRUCache',
+    'filesystem': 'FileSystemCache',
+    'redis': 'RedisCache',
+    'null': 'NullCache',
+}
+
+
+def cache_config():
+    '''
+    Reads the figure cache configuration from the environment.
+
+    FIGURE_CACHE_TYPE selects the backend: 'lru' (default, per worker),
+    'filesystem' (shared by the workers of one machine, in FIGURE_CACHE_DIR),
+    'redis' (shared by all machines, at FIGURE_CACHE_REDIS_URL) or 'null'.
+    FIGURE_CACHE_SIZE is the maximum number of figures of the lru and
+    filesystem caches, FIGURE_CACHE_TTL their lifetime in seconds.
+
+    Returns:
+        dict: The Flask-Caching configuration.
+    '''
+    cache_type = os.environ.get('FIGURE_CACHE_TYPE', 'lru')
+    if cache_type not in CACHE_TYPES:
+        raise ValueError(f'Unknown figure cache "{cache_type}", use one of {", ".join(CACHE_TYPES)}.')
+
+    return {
+        'CACHE_TYPE': CACHE_TYPES[cache_type],
+        'CACHE_THRESHOLD': int(os.environ.get('FIGURE_CACHE_SIZE', 256)),
+        'CACHE_DEFAULT_TIMEOUT': int(os.environ.get('FIGURE_CACHE_TTL', 86400)),
+        'CACHE_DIR': os.environ.get('FIGURE_CACHE_DIR',
+                                    os.path.join(tempfile.gettempdir(), 'spotify-charts-figures')),
+        'CACHE_REDIS_URL': os.environ.get('FIGURE_CACHE_REDIS_URL', 'redis://localhost:6379/0'),
+        'CACHE_KEY_PREFIX': 'figure:',
+    }
+
+
+# The figure cache of the Dash server
+cache = Cache(app.server, config=cache_config())
+
+# Hits and misses per callback of this process
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def figure_key(name, args, version):
+    '''
+    Builds the cache key of a callback call.
+
+    Arguments:
+        name (str): The module and name of the callback.
+        args (tuple): The input and state values of the call.
+        version (str): The data version the figure is built from.
+
+    Returns:
+        str: The callback name, data version and a hash of the inputs.
+    '''
+    inputs = hashlib.sha256(json.dumps(args, sort_keys=True, default=str).encode()).hexdigest()
+    return f'{name}:{version}:{inputs}'
+
+
+def _plain(output):
+    # Figures as plain dicts, which Dash accepts as well and which unpickle
+    # without the validation of the plotly figure objects
+    if isinstance(output, BaseFigure):
+        return output.to_dict()
+    if isinstance(output, (list, tuple)):
+        return type(output)(_plain(item) for item in output)
+    return output
+
+
+def _count(name, counter):
+    with _stats_lock:
+        _stats.setdefault(name, {'hits': 0, 'misses': 0})[counter] += 1
+
+
+def cached_callback(fn):
+    '''
+    Decorator for Dash callbacks whose output only depends on their inputs and
+    the data, like the figures of the pages. Must be placed below
+    @app.callback.
+
+    The output is cached under the callback name, the input values and the
+    data version, so repeated selections skip building the figure and a data
+    update never serves old figures.
+
+    Arguments:
+        fn (callable): The callback.
+
+    Returns:
+        callable: The cached callback.
+    '''
+    name = f'{fn.__module__}.{fn.__qualname__}'
+
+    @functools.wraps(fn)
+    def wrapper(*args):
+        key = figure_key(name, args, data_version())
+        try:
+            output = cache.get(key)
+        except Exception:
+            # An unreachable shared cache only costs the rebuild of the figure
+            logger.exception('Could not read the figure from the cache')
+            output = None
+        if output is not None:
+            _count(name, 'hits')
+            return output
+
+        _count(name, 'misses')
+        output = _plain(fn(*args))
+        try:
+            cache.set(key, output)
+        except Exception:
+            logger.exception('Could not write the figure to the cache')
+        return output
+
+    return wrapper
+
+
+def stats():
+    '''
+    Returns the hit and miss counters per callback of this process.
+
+    Returns:
+        dict: Per callback its hits, misses and hit rate, and the totals.
+    '''
+    with _stats_lock:
+        callbacks = {name: dict(counts) for name, counts in _stats.items()}
+
+    hits = sum(c['hits'] for c in callbacks.values())
+    misses = sum(c['misses'] for c in callbacks.values())
+    for counts in callbacks.values():
+        counts['hit_rate'] = counts['hits'] / (counts['hits'] + counts['misses'])
+    return {
+        'backend': cache.config['CACHE_TYPE'],
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': hits / (hits + misses) if hits + misses else 0.0,
+        'callbacks': callbacks,
+    }
@@ -1,12 +1,51 @@
+import os
 import dash
 from dash import dcc, html
 from dash.dependencies import Input, Output
+from flask import send_from_directory
 from app.pages import home_page, genres_page, polarity_page, solo_collab_page, release_time_page, crisis_page, happiness_score_page, explicity_prediction_page, spotify_stats_page
 from app.app import app
+from app.lazy import warm_up
+from app.datasets import data_version, start_watcher
+from app import figure_cache
+from app.wordclouds import WORDCLOUD_DIR
 
 # Create the server
 server = app.server
 
+# The page modules only register their callbacks on import. Their data and
+# layouts are loaded on the first visit of a page, or in the background right
+# after start when WARM_UP_PAGES=1.
+if os.environ.get('WARM_UP_PAGES') == '1':
+    warm_up([genres_page.get_layout, polarity_page.get_layout, solo_collab_page.get_layout,
+             release_time_page.get_layout, crisis_page.get_layout, happiness_score_page.get_layout,
+             explicity_prediction_page.get_layout, spotify_stats_page.load_data])
+
+# Swap in changed files of data/final_data without a restart, the layouts and
+# figures of the pages are rebuilt for the new data version on their next visit
+start_watcher()
+
+# Current data version of this worker
+@server.route('/data/version')
+def current_data_version():
+    return {'version': data_version()}
+
+# Hit and miss counters of the figure cache of this worker
+@server.route('/figure-cache/stats')
+def figure_cache_stats():
+    return figure_cache.stats()
+
+# Rendered wordclouds, browsers keep them and revalidate with the ETag on
+# every use, python -m app.wordclouds --force renders them again under the
+# same url
+@server.route('/wordclouds/<version>/<name>')
+def wordcloud_image(version, name):
+    response = send_from_directory(WORDCLOUD_DIR, f'{version}/{name}', mimetype='image/png',
+                                   max_age=0, etag=True, conditional=True)
+    response.cache_control.public = True
+    response.cache_control.no_cache = True
+    return response
+
 # Define the head
 head = html.Div([
 
@@ -43,19 +82,19 @@ def display_page(pathname):
     if pathname in ('', '/', 'home', ' '):
         return home_page.layout
     elif pathname == '/genres':
-        return genres_page.layout
+        return genres_page.get_layout()
     elif pathname == '/polarity':
-        return polarity_page.layout
+        return polarity_page.get_layout()
     elif pathname == '/solo_collab':
-        return solo_collab_page.layout
+        return solo_collab_page.get_layout()
     elif pathname == '/release_time':
-        return release_time_page.layout
+        return release_time_page.get_layout()
     elif pathname == '/crisis':
-        return crisis_page.layout
+        return crisis_page.get_layout()
     elif pathname == '/happiness_score':
-        return happiness_score_page.layout
+        return happiness_score_page.get_layout()
     elif pathname == '/explicity_prediction':
-        return explicity_prediction_page.layout
+        return explicity_prediction_page.get_layout()
     elif pathname == '/spotify_stats':
         return spotify_stats_page.layout
     else:
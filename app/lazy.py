@@ -0,0 +1,95 @@
+# Imports
+import logging
+import functools
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+def load_once(fn):
+    '''
+    Decorator for expensive loaders without arguments, like reading the data or
+    building the layout of a page.
+
+    The loader runs on its first call only, concurrent first callers wait for
+    it instead of loading twice. Later calls return the stored result.
+
+    Arguments:
+        fn (callable): The loader.
+
+    Returns:
+        callable: The loader that runs only once.
+    '''
+    lock = threading.Lock()
+    result = []
+
+    @functools.wraps(fn)
+    def wrapper():
+        if not result:
+            with lock:
+                if not result:
+                    result.append(fn())
+        return result[0]
+
+    wrapper.is_loaded = lambda: bool(result)
+    return wrapper
+
+
+def load_per_version(version):
+    '''
+    Decorator for loaders without arguments whose result depends on data that
+    can change while the server runs, like the figures of a page.
+
+    Works like load_once, but the loader runs again on the first call after
+    version() returned a new value. Concurrent callers wait for the rebuild
+    instead of building twice.
+
+    Arguments:
+        version (callable): Returns the current version of the data.
+
+    Returns:
+        callable: The decorator.
+    '''
+    def decorator(fn):
+        lock = threading.Lock()
+        result = []
+
+        @functools.wraps(fn)
+        def wrapper():
+            current = version()
+            if not result or result[0][0] != current:
+                with lock:
+                    if not result or result[0][0] != current:
+                        result[:] = [(current, fn())]
+            return result[0][1]
+
+        wrapper.is_loaded = lambda: bool(result)
+        return wrapper
+
+    return decorator
+
+
+def warm_up(loaders):
+    '''
+    Runs loaders one after another in a background thread, so the pages are
+    ready before their first visitor without delaying the start of the server.
+    A failing loader is logged and the next one still runs.
+
+    Arguments:
+        loaders (list of callable): The loaders to run.
+
+    Returns:
+        threading.Thread: The started thread.
+    '''
+    def run():
+        for loader in loaders:
+            try:
+                loader()
+            except Exception:
+                # The page raises again on its first visit
+                logger.exception('Warming up %s.%s failed', loader.__module__,
+                                 loader.__qualname__)
+
+    thread = threading.Thread(target=run, name='page-warm-up', daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,199 @@
+# Imports
+import os
+import json
+import fcntl
+import threading
+from collections import OrderedDict
+from pathlib import Path
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+from app.datastore import STORE_DIR, atomic_write
+from app.ngrams import encode
+
+# Number of songs whose texts are compressed together
+BLOCK_SIZE = 64
+
+
+def lyrics_path(csv_path, column='lyrics'):
+    # The store of a text column, named after the csv file
+    return STORE_DIR / f'{Path(csv_path).stem}.{column}.arrow'
+
+
+def build(csv_path, column='lyrics'):
+    '''
+    Writes the texts of a csv column into a lyrics store: one uncompressed
+    arrow file with a row per song, the texts as zstd compressed blocks of
+    BLOCK_SIZE songs and the stop word filtered token ids of every song.
+
+    Arguments:
+        csv_path (str or Path): The csv file.
+        column (str): The text column.
+
+    Returns:
+        Path: The written store.
+    '''
+    texts = pd.read_csv(csv_path, usecols=[column])[column].fillna('').astype(str).tolist()
+    token_ids, offsets, vocabulary = encode(texts)
+
+    # Every block is stored in the row of its first song, the other rows
+    # keep the position of their text in the block
+    blocks = [None] * len(texts)
+    starts = np.zeros(len(texts), dtype=np.int32)
+    ends = np.zeros(len(texts), dtype=np.int32)
+    codec = pa.Codec('zstd')
+    for first in range(0, len(texts), BLOCK_SIZE):
+        block = texts[first:first + BLOCK_SIZE]
+        lengths = np.array([len(text) for text in block], dtype=np.int32)
+        ends[first:first + len(block)] = np.cumsum(lengths)
+        starts[first:first + len(block)] = ends[first:first + len(block)] - lengths
+        data = ''.join(block).encode()
+        blocks[first] = (len(data), codec.compress(data, asbytes=True))
+
+    table = pa.table({
+        'start': starts,
+        'end': ends,
+        'size': pa.array([b[0] if b else None for b in blocks], pa.int32()),
+        'block': pa.array([b[1] if b else None for b in blocks], pa.large_binary()),
+        'tokens': pa.LargeListArray.from_arrays(offsets, token_ids),
+    }).replace_schema_metadata({
+        'vocabulary': json.dumps(list(vocabulary)),
+        'block_size': str(BLOCK_SIZE),
+    })
+
+    path = lyrics_path(csv_path, column)
+    with atomic_write(path) as tmp_path:
+        feather.write_feather(table, tmp_path, compression='uncompressed',
+                              chunksize=max(len(table), 1))
+    return path
+
+
+def _array(table, name):
+    # The column as one array, the store is written as a single chunk
+    column = table.column(name)
+    return column.chunk(0) if column.num_chunks == 1 else column.combine_chunks()
+
+
+class LyricsStore:
+    '''
+    The texts of a csv column by row number, memory mapped from a lyrics
+    store.
+
+    Texts are decompressed per block on first use and kept in an LRU of
+    cache_blocks blocks. The token ids of all songs stay in the mapped file
+    and are shared by all workers.
+
+    Attributes:
+        token_ids (numpy.ndarray): The token ids of all songs, one after the
+        other.
+        offsets (numpy.ndarray): Start of every song in token_ids and the end
+        of the last song.
+        vocabulary (list of str): The token of every id.
+    '''
+
+    def __init__(self, path, cache_blocks=None):
+        table = feather.read_table(path, memory_map=True)
+        metadata = table.schema.metadata
+        self.vocabulary = json.loads(metadata[b'vocabulary'])
+        self.block_size = int(metadata[b'block_size'])
+        self._starts = _array(table, 'start').to_numpy()
+        self._ends = _array(table, 'end').to_numpy()
+        self._sizes = _array(table, 'size')
+        self._blocks = _array(table, 'block')
+
+        tokens = _array(table, 'tokens')
+        self.token_ids = tokens.values.to_numpy()
+        self.offsets = tokens.offsets.to_numpy()
+
+        self.cache_blocks = cache_blocks or int(os.environ.get('LYRICS_CACHE_BLOCKS', 64))
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._codec = pa.Codec('zstd')
+
+    def __len__(self):
+        return len(self._starts)
+
+    def _block(self, block):
+        with self._lock:
+            text = self._cache.get(block)
+            if text is not None:
+                self._cache.move_to_end(block)
+                return text
+
+        first = block * self.block_size
+        data = self._codec.decompress(self._blocks[first].as_buffer(),
+                                      self._sizes[first].as_py(), asbytes=True)
+        text = data.decode()
+        with self._lock:
+            self._cache[block] = text
+            while len(self._cache) > self.cache_blocks:
+                self._cache.popitem(last=False)
+        return text
+
+    def text(self, row):
+        '''
+        Returns the text of a song.
+
+        Arguments:
+            row (int): The row of the song in the csv file.
+
+        Returns:
+            str: The text, empty for missing texts.
+        '''
+        return self._block(row // self.block_size)[self._starts[row]:self._ends[row]]
+
+    def texts(self, rows):
+        '''
+        Returns the texts of several songs.
+
+        Arguments:
+            rows (iterable of int): The rows of the songs in the csv file,
+            e.g. the index of a filtered dataset.
+
+        Returns:
+            list of str: The texts in the order of rows.
+        '''
+        return [self.text(row) for row in rows]
+
+    def tokens(self, row):
+        '''
+        Returns the stop word filtered token ids of a song.
+
+        Arguments:
+            row (int): The row of the song in the csv file.
+
+        Returns:
+            numpy.ndarray: The token ids, see vocabulary.
+        '''
+        return self.token_ids[self.offsets[row]:self.offsets[row + 1]]
+
+
+def _is_fresh(path, csv_path):
+    # The store exists and was built after the last change of the csv
+    return path.exists() and path.stat().st_mtime >= Path(csv_path).stat().st_mtime
+
+
+def open_store(csv_path, column='lyrics'):
+    '''
+    Opens the lyrics store of a csv column, building it first if it does not
+    exist or the csv changed after it was built. Only one process builds it,
+    the others wait for the build and open the built store.
+
+    Arguments:
+        csv_path (str or Path): The csv file.
+        column (str): The text column.
+
+    Returns:
+        LyricsStore: The memory mapped store.
+    '''
+    path = lyrics_path(csv_path, column)
+    if not _is_fresh(path, csv_path):
+        # The lock file next to the store is released when it is closed, also
+        # if the process dies while building
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path.with_suffix('.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            if not _is_fresh(path, csv_path):
+                build(csv_path, column)
+    return LyricsStore(path)
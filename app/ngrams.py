@@ -0,0 +1,180 @@
+# Imports
+import re
+from array import array
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS
+import nltk
+from nltk.corpus import stopwords
+from app.lazy import load_once
+
+# Words of at least two letters or digits, like the default of CountVectorizer
+TOKEN_PATTERN = re.compile(r'(?u)\b\w\w+\b')
+
+
+# Stop words of nltk and scikit-learn, loaded on first use
+@load_once
+def load_stop_words():
+    nltk.download('stopwords')
+    return frozenset(stopwords.words('english')) | ENGLISH_STOP_WORDS
+
+
+def tokenize(text, stop_words):
+    # Lower case words without stop words, the tokens of all n-gram orders
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in stop_words]
+
+
+def encode(texts, vocabulary=None):
+    '''
+    Tokenizes texts into token ids.
+
+    Arguments:
+        texts (iterable of str): The texts.
+        vocabulary (dict): Token ids by token, extended by new tokens. None
+        starts a new vocabulary.
+
+    Returns:
+        tuple: The token ids of all texts as one int32 array, the int64
+        offsets of every text into it (one more than texts) and the
+        vocabulary.
+    '''
+    stop_words = load_stop_words()
+    vocabulary = {} if vocabulary is None else vocabulary
+    ids = array('i')
+    offsets = array('q', [0])
+    for text in texts:
+        ids.extend([vocabulary.setdefault(token, len(vocabulary))
+                    for token in tokenize(text, stop_words)])
+        offsets.append(len(ids))
+    return (np.frombuffer(ids, dtype=np.int32), np.frombuffer(offsets, dtype=np.int64),
+            vocabulary)
+
+
+class NgramIndex:
+    '''
+    Counts of the 1- up to max_n-grams of every text as sparse matrices.
+
+    The n-grams are counted from the token ids of the texts, for all texts at
+    once with array operations, so no text is tokenized twice. Counts of any
+    subset of the texts, e.g. a year and location, are a product of a 0/1
+    vector with a matrix instead of tokenizing the texts again.
+
+    Attributes:
+        matrices (dict): Per n-gram order a scipy.sparse.csr_matrix of counts
+        with one row per text and one column per n-gram.
+        keys (dict): Per n-gram order the n-gram of every column as one
+        number, with the token ids as digits, see terms.
+        vocabulary (numpy.ndarray): The token of every id.
+    '''
+
+    def __init__(self, token_ids, offsets, vocabulary, max_n=3):
+        '''
+        Arguments:
+            token_ids (numpy.ndarray): The token ids of all texts, one after
+            the other.
+            offsets (numpy.ndarray): Start of every text in token_ids and the
+            end of the last text.
+            vocabulary (array-like of str): The token of every id.
+            max_n (int): The highest n-gram order.
+        '''
+        token_ids = np.asarray(token_ids, dtype=np.int64)
+        offsets = np.asarray(offsets, dtype=np.int64)
+        self.vocabulary = np.asarray(vocabulary, dtype=object)
+        size = self._size = max(len(vocabulary), 1)
+        if size ** max_n >= 2**63:
+            raise ValueError(f'{len(vocabulary)} tokens are too many for {max_n}-grams.')
+
+        # Text of every token
+        texts = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+
+        self.matrices = {}
+        self.keys = {}
+        for n in range(1, max_n + 1):
+            # n-grams start at every token followed by n - 1 tokens of its text,
+            # each n-gram is one number with the token ids as digits
+            starts = np.arange(max(len(token_ids) - n + 1, 0))
+            starts = starts[texts[starts + n - 1] == texts[starts]]
+            keys = np.zeros(len(starts), dtype=np.int64)
+            for k in range(n):
+                keys = keys * size + token_ids[starts + k]
+            keys, columns = np.unique(keys, return_inverse=True)
+
+            # Rows are the texts, repeated n-grams of a text are summed
+            rows = np.zeros(len(offsets), dtype=np.int64)
+            rows[1:] = np.cumsum(np.bincount(texts[starts], minlength=len(offsets) - 1))
+            matrix = sparse.csr_matrix(
+                (np.ones(len(columns), dtype=np.int32), columns.astype(np.int32), rows),
+                shape=(len(offsets) - 1, len(keys)))
+            matrix.sum_duplicates()
+            self.matrices[n] = matrix
+            self.keys[n] = keys
+
+    @classmethod
+    def from_texts(cls, texts, max_n=3):
+        '''
+        Tokenizes texts and counts their n-grams.
+
+        Arguments:
+            texts (iterable of str): The texts.
+            max_n (int): The highest n-gram order.
+
+        Returns:
+            NgramIndex: The counts of the texts.
+        '''
+        token_ids, offsets, vocabulary = encode(texts)
+        return cls(token_ids, offsets, list(vocabulary), max_n=max_n)
+
+    def __len__(self):
+        return self.matrices[1].shape[0]
+
+    def terms(self, n, columns):
+        '''
+        Returns the n-grams of columns of a matrix.
+
+        Arguments:
+            n (int): The n-gram order.
+            columns (array-like of int): Columns of matrices[n].
+
+        Returns:
+            list of str: The n-grams, words joined by spaces.
+        '''
+        keys = self.keys[n][columns]
+        terms = self.vocabulary[keys // self._size ** (n - 1)]
+        for k in range(n - 2, -1, -1):
+            terms = terms + ' ' + self.vocabulary[keys // self._size ** k % self._size]
+        return terms.tolist()
+
+    def counts(self, mask, n):
+        '''
+        Sums the n-gram counts of a subset of the texts.
+
+        Arguments:
+            mask (array-like of bool): One entry per text, True for the texts
+            to count.
+            n (int): The n-gram order.
+
+        Returns:
+            numpy.ndarray: The count of every n-gram of order n, one per column
+            of matrices[n].
+        '''
+        return self.matrices[n].T @ np.asarray(mask, dtype=np.int32)
+
+    def frequencies(self, mask, n, top=None):
+        '''
+        Returns the n-grams of a subset of the texts with their counts.
+
+        Arguments:
+            mask (array-like of bool): One entry per text, True for the texts
+            to count.
+            n (int): The n-gram order.
+            top (int): Only the top most frequent n-grams, None for all.
+
+        Returns:
+            dict: Per n-gram its count, n-grams that do not occur are left
+            out.
+        '''
+        counts = self.counts(mask, n)
+        columns = np.flatnonzero(counts)
+        if top is not None and len(columns) > top:
+            columns = columns[np.argpartition(counts[columns], -top)[-top:]]
+        return dict(zip(self.terms(n, columns), counts[columns].tolist()))
@@ -1,103 +1,115 @@
 # Imports
-import io
-import base64
-from pathlib import Path
+import queue
+from concurrent.futures import CancelledError
+import dash
 from dash import html, dcc
-from dash.dependencies import Input, Output
+from dash.dependencies import Input, Output, State
 import plotly.express as px
-import plotly.graph_objects as go
 import plotly.subplots as sp
 import pandas as pd
-from wordcloud import WordCloud
-from transformers import AutoModelForSequenceClassification, AutoTokenizer
 from app.app import app
+from app.lazy import load_per_version
+from app.datasets import get_dataset, dataset_hash, data_version
+from app.wordclouds import get_explicity_wordclouds, wordcloud_url
+from app.explicity.config import PREDICTIONS_PATH, default_backend
+from app.explicity.cache import get_prediction_cache, prediction_key
 
-# Function for model prediction
-def model_prediction(text, model, num_labels=2):
-    # Load tokenizer and model from directory
-    tokenizer = AutoTokenizer.from_pretrained(model)
-    model = AutoModelForSequenceClassification.from_pretrained(model, num_labels=num_labels)
-
-    # Tokenize the input lyrics
-    inputs = tokenizer(text, padding='max_length', truncation=True, return_tensors='pt')
-
-    # Prediction
-    outputs = model(**inputs)
-    predictions = outputs.logits.argmax(dim=-1)
-
-    # Result
-    return 'Explicit' if predictions.item() == 1 else 'Not Explicit'
-
-# Read the data
-data_path = Path(__file__).resolve().parents[2] / 'data' / 'final_data' / 'all_locations_with_polarity_and_spotify_without_duplicates.csv'
-df = pd.read_csv(data_path)
-
-#Wordcloud visualisation (Subplot is from ChatGPT)
-explicit_lyrics = ' '.join(df[df['explicit']]['lyrics'])
-non_explicit_lyrics = ' '.join(df[~df['explicit']]['lyrics'])
-
-# Convert to base64
-def wordcloud_to_base64(wordcloud):
-    buffer = io.BytesIO()
-    wordcloud.to_image().save(buffer, format="PNG")
-    buffer.seek(0)
-    img_str = base64.b64encode(buffer.getvalue()).decode()
-    return f"data:image/png;base64,{img_str}"
-
-# Generate wordcloud
-wordcloud_explicit = WordCloud(width=1000, height=1000, colormap='Spectral').generate(explicit_lyrics)
-wordcloud_non_explicit = WordCloud(width=1000, height=1000, colormap='Spectral').generate(non_explicit_lyrics)
-
-# Convert to base 64
-explicit_base64 = wordcloud_to_base64(wordcloud_explicit)
-non_explicit_base64 = wordcloud_to_base64(wordcloud_non_explicit)
-
-# Create subplot
-fig_wordcloud = sp.make_subplots(rows=1, cols=2)
-
-# Add wordcloud as a picture
-fig_wordcloud.add_trace(go.Image(source=explicit_base64), row=1, col=1)
-fig_wordcloud.add_trace(go.Image(source=non_explicit_base64), row=1, col=2)
-fig_wordcloud.update_layout(
-    template='plotly_dark',
-    showlegend=False,
-    margin=dict(l=20, r=20, t=0, b=0),
-    paper_bgcolor="rgba(20,20,20,0.5)",
-    plot_bgcolor="rgba(20,20,20,0.5)",
-    xaxis=dict(showgrid=False, zeroline=False, showticklabels=False),
-    yaxis=dict(showgrid=False, zeroline=False, showticklabels=False),
-    xaxis2=dict(showgrid=False, zeroline=False, showticklabels=False),
-    yaxis2=dict(showgrid=False, zeroline=False, showticklabels=False))
-
-# Distribution chart
-# Rename the label to real name and not binary values
-df['explicit_label'] = df['explicit'].replace({True: 'Explicit', False: 'Not Explicit'})
-
-# Calculate the distribution of explicit and not explicit lyrics
-distribution = df['explicit_label'].value_counts().reset_index()
-distribution.columns = ['Explicit', 'Count']
-distribution['Percentage'] = (distribution['Count'] / distribution['Count'].sum()) * 100
-
-# Visualise as a bar chart
-fig = px.bar(distribution, x='Explicit', y='Count', 
-             labels={'Explicit': 'Explicit/Not Explicit', 'Count': 'Count'}
-)
+# The data with 'explicit' as bool, parsed on first use
+def load_data():
+    return get_dataset('lyrics_unique')
 
-# Set the colors for "Explicit" and "Not Explicit"
-fig.update_traces(
-    text=distribution['Percentage'].round(2).astype(str) + '%',
-    textposition='inside',
-    marker=dict(color=distribution['Explicit'].map({'Explicit': 'red', 'Not Explicit': 'green'}))
-)
+# Build the figures on the first visit of the page
+@load_per_version(data_version)
+def build_figures():
+    df = load_data()
 
-# Adjust the layout
-fig.update_layout(
-    template='plotly_dark',
-    xaxis_title_font=dict(family='Arial', weight='bold'),
-    yaxis_title_font=dict(family='Arial', weight='bold'),
-    paper_bgcolor="rgba(20,20,20,0.5)",
-    plot_bgcolor="rgba(20,20,20,0.5)"
-)
+    # Wordcloud visualisation (Subplot is from ChatGPT), the images are built
+    # once per data version with python -m app.wordclouds
+    wordclouds = get_explicity_wordclouds()
+
+    # Create subplot
+    fig_wordcloud = sp.make_subplots(rows=1, cols=2)
+
+    # Add wordcloud as a picture, referenced by url so the browser caches it
+    for col, path in enumerate((wordclouds['explicit'], wordclouds['not_explicit']), start=1):
+        fig_wordcloud.add_layout_image(
+            source=wordcloud_url(path),
+            xref='x domain', yref='y domain',
+            x=0.5, y=0.5, sizex=1, sizey=1,
+            xanchor='center', yanchor='middle',
+            sizing='contain',
+            row=1, col=col)
+    fig_wordcloud.update_layout(
+        template='plotly_dark',
+        showlegend=False,
+        margin=dict(l=20, r=20, t=0, b=0),
+        paper_bgcolor="rgba(20,20,20,0.5)",
+        plot_bgcolor="rgba(20,20,20,0.5)",
+        xaxis=dict(showgrid=False, zeroline=False, showticklabels=False),
+        yaxis=dict(showgrid=False, zeroline=False, showticklabels=False),
+        xaxis2=dict(showgrid=False, zeroline=False, showticklabels=False),
+        yaxis2=dict(showgrid=False, zeroline=False, showticklabels=False))
+
+    # Distribution chart
+    # Rename the label to real name and not binary values
+    df['explicit_label'] = df['explicit'].replace({True: 'Explicit', False: 'Not Explicit'})
+
+    # Calculate the distribution of explicit and not explicit lyrics
+    distribution = df['explicit_label'].value_counts().reset_index()
+    distribution.columns = ['Explicit', 'Count']
+    distribution['Percentage'] = (distribution['Count'] / distribution['Count'].sum()) * 100
+
+    # Visualise as a bar chart
+    fig = px.bar(distribution, x='Explicit', y='Count', 
+                 labels={'Explicit': 'Explicit/Not Explicit', 'Count': 'Count'}
+    )
+
+    # Set the colors for "Explicit" and "Not Explicit"
+    fig.update_traces(
+        text=distribution['Percentage'].round(2).astype(str) + '%',
+        textposition='inside',
+        marker=dict(color=distribution['Explicit'].map({'Explicit': 'red', 'Not Explicit': 'green'}))
+    )
+
+    # Adjust the layout
+    fig.update_layout(
+        template='plotly_dark',
+        xaxis_title_font=dict(family='Arial', weight='bold'),
+        yaxis_title_font=dict(family='Arial', weight='bold'),
+        paper_bgcolor="rgba(20,20,20,0.5)",
+        plot_bgcolor="rgba(20,20,20,0.5)"
+    )
+
+    # Agreement of the model with the Spotify label, precomputed with python -m app.explicity.bulk
+    agreement_fig = None
+    predictions = pd.read_parquet(PREDICTIONS_PATH) if PREDICTIONS_PATH.exists() else None
+
+    # The rows of the predictions are rows of the csv they were scored from,
+    # predictions of another version of the csv are not shown
+    if predictions is not None and predictions.attrs.get('input_sha256') == dataset_hash('lyrics_unique'):
+        spotify_label = df['explicit'].map({True: 'Explicit', False: 'Not Explicit'})
+        model_label = predictions['explicit_prediction'].reindex(df.index).map({True: 'Explicit', False: 'Not Explicit'})
+        agreement = (spotify_label == model_label).mean() * 100
+
+        # Confusion matrix of the Spotify label and the model prediction
+        confusion = pd.crosstab(spotify_label, model_label).reindex(
+            index=['Explicit', 'Not Explicit'], columns=['Explicit', 'Not Explicit'], fill_value=0)
+        agreement_fig = px.imshow(
+            confusion,
+            text_auto=True,
+            color_continuous_scale='Viridis',
+            labels={'x': 'Model Prediction', 'y': 'Spotify Label', 'color': 'Songs'},
+            title=f'Agreement: {agreement:.2f}%'
+        )
+        agreement_fig.update_layout(
+            template='plotly_dark',
+            xaxis_title_font=dict(family='Arial', weight='bold'),
+            yaxis_title_font=dict(family='Arial', weight='bold'),
+            paper_bgcolor="rgba(20,20,20,0.5)",
+            plot_bgcolor="rgba(20,20,20,0.5)"
+        )
+
+    return fig_wordcloud, fig, agreement_fig
 
 # Style definiton for textstyle
 textstyle={
@@ -111,60 +123,149 @@ textstyle={
     'font-family': 'Arial, sans-serif'
 }
 
-# Layout for Sections
-layout = html.Div([
-
-    html.Div([
-        html.H2('How well can a pretrained roberta model predict the explicity label of a songs lyrics?')
-    ], className='question'),
-
-    html.Div([
-        html.H2('Wordcloud for Song Lyrics (Explicit and Not Explicit) among all locations (Global, Usa, Uk).')
-    ], className='title'),
-
-    # Div: Wordcloud visualisation wirh description
-    html.Div([
-        dcc.Graph(figure=fig_wordcloud),
-        html.Div(
-            "To give you an insight on the words included in explicit and not explicit songs, you can check out the wordcloud from above.",
-            style=textstyle),
-    ], className='container_explicity'),
-
-    html.Div([
-        html.H2('Distribution of Class Labels among all Charts Data')
-    ], className='title'),
-
-    # Div: Visualisation of the label distribution with description
-    html.Div([
-        dcc.Graph(figure=fig),
-        html.Div(
-            "This plot shows the distribution of the explicit labels among all locations (Global, Usa, Uk)."
-            "Global and Uk both have quite balanced labels, but the Usa stands out with 5870 to 4100 labels "
-            "marked as explicit and not explicit.",
-            style=textstyle),
-    ], className='container_explicity'),
-
-    html.Div([
-        html.H2('Explicity Prediction')
-    ], className='title'),
+# Layout for Sections, built on the first visit of the page
+@load_per_version(data_version)
+def get_layout():
+    fig_wordcloud, fig, agreement_fig = build_figures()
+
+    return html.Div([
+
+        html.Div([
+            html.H2('How well can a pretrained roberta model predict the explicity label of a songs lyrics?')
+        ], className='question'),
+
+        html.Div([
+            html.H2('Wordcloud for Song Lyrics (Explicit and Not Explicit) among all locations (Global, Usa, Uk).')
+        ], className='title'),
+
+        # Div: Wordcloud visualisation wirh description
+        html.Div([
+            dcc.Graph(figure=fig_wordcloud),
+            html.Div(
+                "To give you an insight on the words included in explicit and not explicit songs, you can check out the wordcloud from above.",
+                style=textstyle),
+        ], className='container_explicity'),
+
+        html.Div([
+            html.H2('Distribution of Class Labels among all Charts Data')
+        ], className='title'),
+
+        # Div: Visualisation of the label distribution with description
+        html.Div([
+            dcc.Graph(figure=fig),
+            html.Div(
+                "This plot shows the distribution of the explicit labels among all locations (Global, Usa, Uk)."
+                "Global and Uk both have quite balanced labels, but the Usa stands out with 5870 to 4100 labels "
+                "marked as explicit and not explicit.",
+                style=textstyle),
+        ], className='container_explicity'),
+
+        # Div: Agreement of the model with the Spotify labels, only shown once the corpus was scored
+        *([
+            html.Div([
+                html.H2('Model Prediction vs. Spotify Label among all Charts Data')
+            ], className='title'),
+
+            html.Div([
+                dcc.Graph(figure=agreement_fig),
+                html.Div(
+                    "This matrix compares the explicity predicted by the model with the label provided by Spotify for every song.",
+                    style=textstyle),
+            ], className='container_explicity'),
+        ] if agreement_fig is not None else []),
+
+        html.Div([
+            html.H2('Explicity Prediction')
+        ], className='title'),
     
-    # Div: Textarea for lyrics input and prediction output field
-    html.Div([
+        # Div: Textarea for lyrics input, predict button and prediction output field
+        # The prediction runs when leaving the textarea or clicking the button, not on every keystroke
+        html.Div([
 
-            dcc.Textarea(id='lyrics-input', placeholder='Enter your lyrics here...', style={'width': '100%', 'height': 200}),
-            html.Div(id='prediction-output', style={'marginTop': '20px'}),
-    ], className='container_explicity')
+                dcc.Store(id='prediction-session', storage_type='session'),
+                dcc.Textarea(id='lyrics-input', placeholder='Enter your lyrics here...', style={'width': '100%', 'height': 200}),
+                dcc.Checklist(
+                    id='full-song-mode',
+                    options=[{'label': ' Scan the full song (lyrics longer than 512 tokens are split into overlapping windows)', 'value': 'windowed'}],
+                    value=[],
+                    style=textstyle),
+                html.Button('Predict', id='predict-button', n_clicks=0, className='predict-button'),
+                html.Div(id='prediction-output', style={'marginTop': '20px'}),
+        ], className='container_explicity')
 
-])
+    ])
+
+# Identify the browser session when the page loads, before any prediction can
+# fire, so a newer request of the session replaces an older one. The layout is
+# shared by all sessions, so the id is created in the browser.
+app.clientside_callback(
+    '''
+    function(session) {
+        if (session) {
+            return session;
+        }
+        return window.crypto && window.crypto.randomUUID
+            ? window.crypto.randomUUID()
+            : Math.random().toString(36).slice(2) + Date.now().toString(36);
+    }
+    ''',
+    Output('prediction-session', 'data'),
+    Input('prediction-session', 'data')
+)
 
-# Callback for changes in the text field
+# Callback for the predict button, typing and leaving the text field do not
+# predict, so the model only runs for lyrics the user submitted
 @app.callback(
     Output('prediction-output', 'children'),
-    [Input('lyrics-input', 'value')]
+    [Input('predict-button', 'n_clicks'),
+     Input('full-song-mode', 'value')],
+    [State('lyrics-input', 'value'),
+     State('prediction-session', 'data')]
 )
-def update_prediction(lyrics):
+def update_prediction(n_clicks, mode, lyrics, session_id):
+    windowed = 'windowed' in (mode or [])
+
     if lyrics:
-        model = Path(__file__).resolve().parents[2] / 'data' / 'trained_model_explicity'
-        prediction = model_prediction(lyrics, model)
-        return f'The song is probably: {prediction}'
+        # Answer lyrics that were already predicted from the cache
+        cache = get_prediction_cache()
+        key = prediction_key(lyrics, default_backend(), 'windowed' if windowed else 'truncated')
+        prediction = cache.get(key)
+
+        # Torch is only imported once a prediction is requested
+        from app.explicity.batching import get_predictor
+        from app.explicity.cascade import get_cascade
+
+        # Confident lyrics are answered by the fast lexical classifier
+        cascade = get_cascade()
+        if prediction is None and cascade is not None:
+            prediction = cascade.predict(lyrics)
+            if prediction is not None:
+                cache.set(key, prediction)
+
+        if prediction is None:
+            # Queue the lyrics, they are predicted together with other requests
+            try:
+                prediction = get_predictor().predict(lyrics, timeout=30, key=session_id, windowed=windowed)
+            except CancelledError:
+                # A newer request of this session replaced this one
+                return dash.no_update
+            except (queue.Full, TimeoutError):
+                return 'The prediction service is busy, please try again in a moment.'
+            cache.set(key, prediction)
+
+        if not windowed or 'window' not in prediction:
+            return f'The song is probably: {prediction["label"]}'
+
+        # Show which part of the song decided the verdict
+        return [
+            html.Div(f'The song is probably: {prediction["label"]} '
+                     f'(decided by window {prediction["window"] + 1} of {prediction["windows"]})'),
+            html.Blockquote(prediction['excerpt'], style={'white-space': 'pre-wrap', 'font-size': '14px'}),
+        ]
     return 'Please enter some lyrics first.'
+
+
+# Hit and miss counters of the prediction cache of this worker
+@app.server.route('/explicity/cache-stats')
+def prediction_cache_stats():
+    return get_prediction_cache().stats()
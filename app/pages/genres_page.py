@@ -1,23 +1,240 @@
+from flask import request
 from dash import html, dcc, Input, Output
 import plotly.graph_objects as go
 import plotly.express as px
+import numpy as np
 import pandas as pd
 from app.app import app
-from pathlib import Path
+from app.figure_cache import cached_callback
+from app.lazy import load_per_version
+from app.datasets import get_dataset, data_version
 
-# Read the data
-data_path = Path(__file__).resolve(
-    ).parents[2]/ 'data' / 'final_data' / 'global_17-24_daily_with_exploded_'\
-                                                                 'genres.csv'
-df = pd.read_csv(data_path)
+def load_data():
+    '''
+    Returns the daily charts with exploded genres, parsed on first use.
+
+    Returns:
+        pandas.DataFrame: The charts data with 'date' as datetime and 'genres'
+        as category.
+    '''
+    return get_dataset('genres_daily')
+
+@load_per_version(data_version)
+def load_genre_counts():
+    '''
+    Counts the chart entries per genre once per data version, by day, week,
+    month and year. The charts are answered from these counts, so they do not
+    get slower with more daily chart rows.
+
+    Returns:
+        dict: For 'day', 'week', 'month' and 'year' a DataFrame with one row
+        per period ('day' and 'week' as datetime of the first day, 'month' as
+        'YYYY-MM', 'year' as int) and one int32 column of counts per genre.
+    '''
+    df = load_data()
+
+    # Day x genre count matrix, genres without entries are left out
+    daily = df.groupby([df['date'].dt.normalize(), 'genres'], observed=True
+                       ).size().unstack(fill_value=0).astype('int32')
+    daily.columns = daily.columns.astype(str)
+
+    # Coarser periods are sums over the days
+    weekly = daily.groupby(daily.index.to_period('W').start_time).sum()
+    monthly = daily.groupby(daily.index.to_period('M')).sum()
+    monthly.index = monthly.index.astype(str)
+    yearly = daily.groupby(daily.index.year).sum()
+
+    return {'day': daily, 'week': weekly, 'month': monthly, 'year': yearly}
+
+def diversity_indices(counts):
+    '''
+    Computes the genre diversity of every period in one pass over a count
+    matrix. Entries without identified genre ('Not Found') are left out.
+
+    Arguments:
+        counts (pandas.DataFrame): The number of entries per period and genre.
+
+    Returns:
+        pandas.DataFrame: Per period with identified genres the Shannon
+        entropy ('shannon', natural log), the Herfindahl-Hirschman index of
+        the genre shares ('hhi') and the effective number of genres
+        ('effective_genres', the exponential of the entropy).
+    '''
+    identified = counts.drop(columns='Not Found', errors='ignore')
+    identified = identified[identified.sum(axis=1) > 0]
+
+    values = identified.to_numpy(dtype='float64')
+    shares = values / values.sum(axis=1, keepdims=True)
 
-# Ensure 'date' column is string
-df['date'] = df['date'].astype(str)
+    # Genres without entries add nothing to the entropy
+    log_shares = np.log(shares, out=np.zeros_like(shares), where=shares > 0)
+    shannon = -(shares * log_shares).sum(axis=1)
 
-# Extract available years and genres for dropdown menus
-available_years = sorted(df['date'].str[:4].unique(), key=int)
-available_genres = sorted(df['genres'].unique(), key=str)
-available_genres.remove('Not Found')
+    return pd.DataFrame({
+        'shannon': shannon,
+        'hhi': (shares ** 2).sum(axis=1),
+        'effective_genres': np.exp(shannon),
+    }, index=identified.index)
+
+@load_per_version(data_version)
+def load_diversity():
+    '''
+    Computes the genre diversity per day, week and month once per data
+    version, together with its cumulative sums for rolling means.
+
+    Returns:
+        dict: For 'day', 'week' and 'month' the 'indices' as returned by
+        diversity_indices and their 'cumulative' sums over the periods.
+    '''
+    counts = load_genre_counts()
+    diversity = {}
+    for granularity in ('day', 'week', 'month'):
+        indices = diversity_indices(counts[granularity])
+        diversity[granularity] = {'indices': indices, 'cumulative': indices.cumsum()}
+    return diversity
+
+def rolling_mean(cumulative, window):
+    '''
+    Rolling mean over the last window rows, computed from cumulative sums like
+    DataFrame.rolling(window, min_periods=1).mean().
+
+    Arguments:
+        cumulative (pandas.DataFrame): The cumulative sums over the rows.
+        window (int): The number of rows per mean.
+
+    Returns:
+        pandas.DataFrame: The rolling means.
+    '''
+    values = cumulative.to_numpy()
+    window = max(int(window), 1)
+
+    # Sums of the last window rows are differences of two cumulative sums
+    before = np.zeros_like(values)
+    before[window:] = values[:-window]
+    sizes = np.minimum(np.arange(1, len(values) + 1), window)[:, None]
+
+    return pd.DataFrame((values - before) / sizes, index=cumulative.index,
+                        columns=cumulative.columns)
+
+def diversity_series(granularity='month', window=1):
+    '''
+    Returns the genre diversity per period, smoothed with a rolling mean.
+
+    Arguments:
+        granularity (str): 'day', 'week' or 'month'.
+        window (int): The number of periods per rolling mean, 1 for none.
+
+    Returns:
+        pandas.DataFrame: The 'shannon', 'hhi' and 'effective_genres' series.
+    '''
+    if granularity not in ('day', 'week', 'month'):
+        raise ValueError(f'Unknown granularity "{granularity}", use "day", "week" or "month".')
+    return rolling_mean(load_diversity()[granularity]['cumulative'], window)
+
+@load_per_version(data_version)
+def load_rank_histogram():
+    '''
+    Counts the chart entries per genre and rank once per data version, the
+    cumulative counts over the ranks give the quantiles of the box plot.
+
+    Returns:
+        dict: 'counts' and 'cumulative' as DataFrames with one row per genre
+        and one int32 column per rank (1 up to the lowest rank).
+    '''
+    df = load_data()
+    ranks = pd.RangeIndex(1, max(200, int(df['rank'].max())) + 1, name='rank')
+
+    counts = df.groupby(['genres', 'rank'], observed=True).size().unstack(
+        fill_value=0).reindex(columns=ranks, fill_value=0).astype('int32')
+    counts.index = counts.index.astype(str)
+
+    return {'counts': counts, 'cumulative': counts.cumsum(axis=1)}
+
+def rank_quantile(cumulative, q):
+    '''
+    Returns a quantile of the ranks from their cumulative counts, linearly
+    interpolated between two ranks like numpy.percentile.
+
+    Arguments:
+        cumulative (numpy.ndarray): The cumulative counts of ranks 1, 2, ...
+        q (float): The quantile between 0 and 1.
+
+    Returns:
+        float: The rank at the quantile.
+    '''
+    position = q * (cumulative[-1] - 1)
+    below, above = np.floor(position), np.ceil(position)
+
+    # The k-th smallest rank (from 0) is the first rank with more than k entries
+    rank_below = np.searchsorted(cumulative, below, side='right') + 1
+    rank_above = np.searchsorted(cumulative, above, side='right') + 1
+    return rank_below + (rank_above - rank_below) * (position - below)
+
+@load_per_version(data_version)
+def load_rank_date_cube():
+    '''
+    Builds the 2-D prefix sums of the chart entries over days and ranks for
+    every genre once per data version. The entries of any date window and rank
+    range are then four lookups, no matter how wide the window is.
+
+    The cube needs 4 bytes per day, rank and genre, e.g. about 70 MB for eight
+    years of daily charts with 200 ranks and 30 genres.
+
+    Returns:
+        dict: 'days' (pandas.DatetimeIndex), 'genres' (pandas.Index) and
+        'prefix', an int32 array of shape (days + 1, ranks + 1, genres) where
+        prefix[d, r, g] counts the entries of genre g before day d with a rank
+        up to r.
+    '''
+    df = load_data()
+    df = df[df['date'].notna() & df['genres'].notna()]
+    dates = df['date'].dt.normalize()
+    days = pd.DatetimeIndex(dates.unique()).sort_values()
+    genres = df['genres'].cat.categories.astype(str)
+    max_rank = max(200, int(df['rank'].max()))
+
+    # Entries per day, rank and genre, filled into a dense array
+    counts = df.groupby([days.get_indexer(dates), df['rank'].to_numpy(),
+                         df['genres'].cat.codes.to_numpy()]).size()
+    day, rank, genre = (counts.index.get_level_values(i) for i in range(3))
+    prefix = np.zeros((len(days) + 1, max_rank + 1, len(genres)), dtype='int32')
+    prefix[day + 1, rank, genre] = counts.to_numpy()
+
+    # Prefix sums over the days and the ranks, in place
+    np.cumsum(prefix, axis=0, out=prefix)
+    np.cumsum(prefix, axis=1, out=prefix)
+
+    return {'days': days, 'genres': genres, 'prefix': prefix}
+
+def window_counts(start_date, end_date, rank_start, rank_end):
+    '''
+    Returns the number of chart entries per genre from start_date to end_date
+    with a rank from rank_start to rank_end, from the prefix sums.
+
+    Arguments:
+        start_date (str): The first day of the window, None for the first day
+        of the data.
+        end_date (str): The last day of the window, None for the last day of
+        the data.
+        rank_start (int): The highest rank of the range.
+        rank_end (int): The lowest rank of the range.
+
+    Returns:
+        pandas.Series: The number of entries per genre.
+    '''
+    cube = load_rank_date_cube()
+    days, prefix = cube['days'], cube['prefix']
+
+    # Prefix rows before the first and up to the last day of the window
+    first = days.searchsorted(pd.Timestamp(start_date).normalize()) if start_date else 0
+    last = days.searchsorted(pd.Timestamp(end_date).normalize(), side='right') if end_date else len(days)
+    last = max(first, last)
+    rank_start = min(max(int(rank_start), 1), prefix.shape[1] - 1)
+    rank_end = min(max(int(rank_end), rank_start), prefix.shape[1] - 1)
+
+    counts = (prefix[last, rank_end] - prefix[first, rank_end]
+              - prefix[last, rank_start - 1] + prefix[first, rank_start - 1])
+    return pd.Series(counts, index=cube['genres'])
 
 def generate_bar_chart(year):
     '''
@@ -32,12 +249,41 @@ def generate_bar_chart(year):
         as percentages.
     '''
 
-    # Filter data for the selected year and exlude Not Found
-    df_year = df[(df['date'].str[:4] == str(year))].copy()
+    yearly = load_genre_counts()['year']
+
+    # Counts of the selected year
+    return generate_share_bar_chart(yearly.reindex([int(year)], fill_value=0).iloc[0])
 
-    # Count occurrences of each genre and convert to percentage
-    genre_counts_year = df_year['genres'].value_counts(normalize=True
-                                                       ).reset_index()
+def generate_window_bar_chart(start_date, end_date, rank_range):
+    '''
+    Generates a bar chart showing the genre distribution (as percentages) for
+    the chart entries of a date window within a rank range.
+
+    Arguments:
+        start_date (str): The first day of the window.
+        end_date (str): The last day of the window.
+        rank_range (list of int): The highest and lowest rank of the range.
+
+    Returns:
+        plotly.express.Figure: A bar chart showing the genre distribution
+        as percentages.
+    '''
+    return generate_share_bar_chart(window_counts(start_date, end_date, *rank_range))
+
+def generate_share_bar_chart(counts):
+    '''
+    Generates a bar chart showing the share of every genre in the given counts.
+
+    Arguments:
+        counts (pandas.Series): The number of chart entries per genre.
+
+    Returns:
+        plotly.express.Figure: A bar chart showing the genre distribution
+        as percentages.
+    '''
+    # Counts as share, genres without songs are left out
+    counts = counts[counts > 0]
+    genre_counts_year = (counts / counts.sum()).rename_axis('genres').reset_index()
     genre_counts_year.columns = ['Genre', 'Percentage']
     genre_counts_year['Percentage'] = genre_counts_year['Percentage'] * 100
 
@@ -82,7 +328,30 @@ def generate_bar_chart(year):
 
     return bar_fig
 
-def generate_line_plot(threshold=0.05):
+@load_per_version(data_version)
+def load_genre_trend():
+    '''
+    Prepares the genre trend plot once per data version: the monthly genre
+    percentages, their cumulative sums for the smoothing and the overall share
+    of every genre for the threshold.
+
+    Returns:
+        dict: 'cumulative' as DataFrame with one row per month and one column
+        per genre without 'Not Found', 'shares' as Series of the overall
+        share of every genre.
+    '''
+    genre_counts = load_genre_counts()['month']
+    genre_percentages = genre_counts.div(genre_counts.sum(axis=1), axis=0) * 100
+
+    # Remove 'Not Found' genre
+    genre_percentages = genre_percentages.drop(columns='Not Found', errors='ignore')
+
+    return {
+        'cumulative': genre_percentages.cumsum(),
+        'shares': genre_counts.sum() / genre_counts.sum().sum(),
+    }
+
+def generate_line_plot(threshold=0.05, window=3):
     '''
     Generates a line plot showing the genre representation (as percentages) over
     the entire data (2017 - 2024). A threshold can be applied filter the genres
@@ -91,32 +360,20 @@ def generate_line_plot(threshold=0.05):
     Arguments:
         threshold (float): The threshold do filter the genres. Default is 0.05
         i.d. 5%.
+        window (int): The number of months per rolling mean. Default is 3.
 
     Returns:
         plotly.graph_objects.Figure: A bar chart showing the genre distribution
         as percentages.
     '''
-    df_copy = df.copy()
-    df_copy['year-month'] = df_copy['date'].str[:7]
-
-    # Compute genre counts and percentages
-    genre_counts = df_copy.groupby(['year-month', 'genres']
-                                   ).size().unstack(fill_value=0)
-    genre_percentages = genre_counts.div(genre_counts.sum(axis=1), axis=0) * 100
+    trend = load_genre_trend()
 
     # Drop genres which do not meet threshold
-    total_counts = genre_counts.sum().sum()
-    dynamic_threshold = total_counts * threshold
-    dropped = genre_counts.columns[genre_counts.sum() < dynamic_threshold]
-    genre_percentages = genre_percentages.drop(columns=dropped)
-
-    # Remove 'Not Found' genre
-    if 'Not Found' in genre_counts.columns:
-        genre_percentages = genre_percentages.drop(columns=['Not Found'])
+    kept = trend['shares'].index[trend['shares'] >= threshold]
+    cumulative = trend['cumulative'][[g for g in trend['cumulative'].columns if g in kept]]
 
     # Smooth data for line plot
-    smoothed_genre_percentages = genre_percentages.rolling(window=3,
-                                                           min_periods=1).mean()
+    smoothed_genre_percentages = rolling_mean(cumulative, window)
 
     # Reduce number of x-axis labels
     x_tickvals = smoothed_genre_percentages.index[::5]
@@ -169,39 +426,87 @@ def generate_line_plot(threshold=0.05):
 
     return line_fig
 
-def generate_pie_chart(genre):
+# Names of the diversity measures for the plot
+diversity_measures = {
+    'effective_genres': 'Effective Number of Genres',
+    'shannon': 'Shannon Entropy',
+    'hhi': 'Herfindahl-Hirschman Index',
+}
+
+def generate_diversity_plot(granularity='month', measure='effective_genres', window=3):
+    '''
+    Generates a line plot of the genre diversity over time.
+
+    Arguments:
+        granularity (str): 'day', 'week' or 'month'.
+        measure (str): 'effective_genres', 'shannon' or 'hhi'.
+        window (int): The number of periods per rolling mean.
+
+    Returns:
+        plotly.graph_objects.Figure: A line plot of the diversity measure.
+    '''
+    series = diversity_series(granularity, window)[measure]
+
+    diversity_fig = go.Figure(go.Scatter(
+        x=series.index,
+        y=series,
+        mode='lines',
+        name=diversity_measures[measure],
+        line=dict(color=px.colors.qualitative.Vivid[0])
+    ))
+
+    diversity_fig.update_layout(
+        height=500,
+        paper_bgcolor='rgba(20,20,20,0.5)',
+        plot_bgcolor='rgba(20,20,20,0.5)',
+        font=dict(color='white'),
+        xaxis=dict(
+            title=dict(text=granularity.capitalize(), font=dict(size=16, weight='bold')),
+            tickfont=dict(size=14),
+            showgrid=True,
+            gridcolor='rgba(200, 200, 200, 0.3)',
+            gridwidth=0.5
+        ),
+        yaxis=dict(
+            title=dict(text=diversity_measures[measure],
+                       font=dict(size=16, weight='bold')),
+            tickfont=dict(size=14),
+            showgrid=True,
+            gridcolor='rgba(200, 200, 200, 0.3)',
+            gridwidth=0.5
+        )
+    )
+
+    return diversity_fig
+
+def generate_pie_chart(genre, tiers=(66, 133), start_date=None, end_date=None):
     '''
     Generates a pie chart showing the genre distribution (as percentages)
     across three rank ranges for a given genre.
 
     Arguments:
         genre (str): The genre to show the distribution for
+        tiers (list of int): The last rank of the upper and of the mid range.
+        start_date (str): The first day to count, None for all days.
+        end_date (str): The last day to count, None for all days.
 
     Returns:
         plotly.express.Figure: A pie chart showing the genre distribution
         across three rank ranges as percentages.
     '''
     # Define the rank ranges
+    upper_end, mid_end = tiers
     rank_ranges = {
-        'Upper': (1, 66),
-        'Mid': (67, 133),
-        'Lower': (134, 200)
+        'Upper': (1, upper_end),
+        'Mid': (upper_end + 1, mid_end),
+        'Lower': (mid_end + 1, 200)
     }
 
-    # Initialize a dictionary to store the results
-    genre_counts = {}
-
-    # Loop through each rank range and count songs per genre
-    for range_name, (start, end) in rank_ranges.items():
-        # Filter the DataFrame for the current rank range
-        filtered_df = df[(df['rank'] >= start) & (df['rank'] <= end)]
-
-        # Count the number of songs per genre in the filtered DataFrame
-        genre_counts[range_name] = filtered_df['genres'].value_counts(
-                                                       ).rename(range_name)
-
-    # Combine the results into a single DataFrame
-    result_df = pd.concat(genre_counts, axis=1).fillna(0).astype(int)
+    # Count the songs per genre and rank range from the prefix sums
+    result_df = pd.DataFrame({
+        range_name: window_counts(start_date, end_date, start, end)
+        for range_name, (start, end) in rank_ranges.items()
+    })
 
     # Ensure the genre exists in the dataset
     if genre not in result_df.index:
@@ -244,16 +549,39 @@ def generate_boxplot(genre):
         plotly.express.Figure: A boxplot showing the genre distribution
         across the ranks as percentages.
     '''
-    # Filter data for the selected genre
-    df_genre = df[df['genres'] == genre].copy()
-    
-    # Create a box plot
-    rank_fig = px.box(
-        df_genre,
-        y='rank',
-        labels={'rank': 'Chart Rank'},
-        color_discrete_sequence=px.colors.qualitative.Vivid
-    )
+    # Rank counts of the selected genre
+    histogram = load_rank_histogram()
+    rank_fig = go.Figure()
+    if genre in histogram['counts'].index:
+        counts = histogram['counts'].loc[genre]
+        cumulative = histogram['cumulative'].loc[genre].to_numpy()
+
+        # Box statistics from the histogram, the whiskers end at the lowest and
+        # highest rank within 1.5 interquartile ranges of the box
+        q1, median, q3 = (rank_quantile(cumulative, q) for q in (0.25, 0.5, 0.75))
+        found = counts.index[counts > 0]
+        lowerfence = found[found >= q1 - 1.5 * (q3 - q1)].min()
+        upperfence = found[found <= q3 + 1.5 * (q3 - q1)].max()
+
+        # Create a box plot with the precomputed statistics
+        rank_fig.add_trace(go.Box(
+            q1=[q1], median=[median], q3=[q3],
+            lowerfence=[lowerfence], upperfence=[upperfence],
+            name=genre, x=[genre],
+            marker_color=px.colors.qualitative.Vivid[0]
+        ))
+
+        # Ranks outside the whiskers, one point per rank
+        outliers = found[(found < lowerfence) | (found > upperfence)]
+        rank_fig.add_trace(go.Scatter(
+            x=[genre] * len(outliers), y=outliers,
+            mode='markers',
+            marker_color=px.colors.qualitative.Vivid[0],
+            customdata=counts[outliers],
+            hovertemplate='Rank %{y}: %{customdata} entries<extra></extra>'
+        ))
+
+    rank_fig.update_layout(showlegend=False)
 
     # Improve styling
     rank_fig.update_layout(
@@ -272,14 +600,12 @@ def generate_boxplot(genre):
 
     return rank_fig
 
-# Generate initial plots with initial values
+# Initial values of the dropdowns
 initial_year = '2020'
 initial_genre = 'Pop'
 
-year_bar_fig = generate_bar_chart(initial_year)
-line_fig = generate_line_plot()
-rank_pie_fig = generate_pie_chart(initial_genre)
-rank_box_fig = generate_boxplot(initial_genre)
+# Initial last ranks of the upper and the mid rank range
+initial_tiers = [66, 133]
 
 # Style definitions for dropdown and textstyle
 dropdown_style = {
@@ -301,101 +627,273 @@ textstyle={
     'font-family': 'Arial, sans-serif'
 }
 
-layout = html.Div([
-
-    html.Div([
-        html.H2('How did the Diversity of Music Genres in the Spotify Daily '
-        'Global Charts since 2017 evolve? '
-        'How are the Genres distributed among the Chart Ranks and are there '
-        'Genres dominating some Rank ranges?')
-    ], className='question'),
-
-    html.Div([
-        html.H2('Evolution of Genres in Daily Global Charts (2017-2024)')
-    ], className='title'),
-
-    html.Div([
-        dcc.Graph(id='genre-trend-plot', figure=line_fig),
-        html.Div(
-            'This line chart illustrates the evolution of genre representation '
-            'in the daily global Spotify Charts from 2017 to 2025. '
-            'The x-axis represents the months over the years, while the y-axis '
-            'shows the relative frequency of each genre. For some tracks the '
-            'genre could not be identified. In total, ~22.57% of tracks were '
-            'affected by this. To maintain clarity, genres that appeared in'
-            'less than 5% of the dataset were excluded from this'
-            'visualization.',
-        style=textstyle)
-    ], className='container_genres'),
-
-    html.Div([
-        html.H2('Genre Distribution for a Year')
-    ], className='title'),
-
-    html.Div([
-        dcc.Dropdown(
-            id='year-dropdown',
-            options=[{'label': year, 'value': year}
-                     for year in available_years],
-            value=initial_year,
-            clearable=False,
-            style=dropdown_style),
-        dcc.Graph(id='genre-bar-plot', figure=year_bar_fig),
-        html.Div(
-            'This bar chart provides the distribution of representation of all '
-            'found music genres for a given year.It is meant to provide a more '
-            'detailed look by showing all found genres, including a '
-            'representation for all not identified genres (in "Not Found").',
-            style=textstyle),
-    ], className='container_genres'),
-
-    html.Div([
-        html.H2('Distribution of a Genre\'s Representation by Rank and '
-                'Rank ranges')
-    ], className='title'),
-
-    html.Div([
-        dcc.Dropdown(
-            id='genre-dropdown',
-            options=[{'label': genre, 'value': genre} 
-                     for genre in available_genres],
-            value=initial_genre,
-            clearable=False,
-            style=dropdown_style),
-
-        dcc.Graph(id='genre-pie-plot', figure=rank_pie_fig),
-        html.Div(
-            'This pie chart visualizes how different music genres are '
-            'distributed across chart rank ranges and whether certain genres '
-            'dominate specific rank ranges. The rank ranges are categorized '
-            'into three tiers: upper (1-66), mid (67-133), and lower '
-            '(134-200).\n'
-            'The boxplot visualizes how different music genres are '
-            'distributed across chart ranks. It is meant to provide a more '
-            'detailed insight into the distribution of music genres across '
-            'ranks in contrast to the previous pie chart.',
-            style=textstyle),
-
-        dcc.Graph(id='genre-box-plot', figure=rank_box_fig),
-    ], className='container_genres')
-
-])
+@load_per_version(data_version)
+def get_layout():
+    '''
+    Builds the layout with the initial plots on the first visit of the page.
+
+    Returns:
+        dash.html.Div: The layout of the page.
+    '''
+    yearly = load_genre_counts()['year']
+    days = load_rank_date_cube()['days']
+
+    # Extract available years and genres for dropdown menus
+    available_years = [str(year) for year in yearly.index]
+    available_genres = sorted(yearly.columns)
+    available_genres.remove('Not Found')
+
+    # Generate initial plots with initial values
+    year_bar_fig = generate_bar_chart(initial_year)
+    window_bar_fig = generate_window_bar_chart(None, None, [1, 200])
+    line_fig = generate_line_plot()
+    diversity_fig = generate_diversity_plot()
+    rank_pie_fig = generate_pie_chart(initial_genre)
+    rank_box_fig = generate_boxplot(initial_genre)
+
+    return html.Div([
+
+        html.Div([
+            html.H2('How did the Diversity of Music Genres in the Spotify Daily '
+            'Global Charts since 2017 evolve? '
+            'How are the Genres distributed among the Chart Ranks and are there '
+            'Genres dominating some Rank ranges?')
+        ], className='question'),
+
+        html.Div([
+            html.H2('Evolution of Genres in Daily Global Charts (2017-2024)')
+        ], className='title'),
+
+        html.Div([
+            dcc.Slider(
+                id='trend-threshold',
+                min=0, max=20, step=1,
+                value=5,
+                marks={threshold: f'{threshold}%' for threshold in (0, 5, 10, 15, 20)},
+                tooltip={'placement': 'bottom', 'always_visible': True}),
+            dcc.Slider(
+                id='trend-window',
+                min=1, max=12, step=1,
+                value=3,
+                marks={window: str(window) for window in (1, 3, 6, 12)},
+                tooltip={'placement': 'bottom', 'always_visible': True}),
+            dcc.Graph(id='genre-trend-plot', figure=line_fig),
+            html.Div(
+                'This line chart illustrates the evolution of genre representation '
+                'in the daily global Spotify Charts from 2017 to 2025. '
+                'The x-axis represents the months over the years, while the y-axis '
+                'shows the relative frequency of each genre. For some tracks the '
+                'genre could not be identified. In total, ~22.57% of tracks were '
+                'affected by this. To maintain clarity, genres that appeared in '
+                'less than 5% of the dataset were excluded from this '
+                'visualization. The upper slider changes this threshold, the '
+                'lower slider the number of months each point is averaged over.',
+            style=textstyle)
+        ], className='container_genres'),
+
+        html.Div([
+            html.H2('Diversity of Genres in Daily Global Charts (2017-2024)')
+        ], className='title'),
+
+        html.Div([
+            dcc.Dropdown(
+                id='diversity-measure',
+                options=[{'label': label, 'value': measure}
+                         for measure, label in diversity_measures.items()],
+                value='effective_genres',
+                clearable=False,
+                style=dropdown_style),
+            dcc.Dropdown(
+                id='diversity-granularity',
+                options=[{'label': 'Daily', 'value': 'day'},
+                         {'label': 'Weekly', 'value': 'week'},
+                         {'label': 'Monthly', 'value': 'month'}],
+                value='month',
+                clearable=False,
+                style=dropdown_style),
+            dcc.Slider(
+                id='diversity-window',
+                min=1, max=30, step=1,
+                value=3,
+                marks={window: str(window) for window in (1, 7, 14, 30)},
+                tooltip={'placement': 'bottom', 'always_visible': True}),
+            dcc.Graph(id='genre-diversity-plot', figure=diversity_fig),
+            html.Div(
+                'This line chart shows how diverse the identified genres in the '
+                'charts were. The effective number of genres is the number of '
+                'equally common genres that would give the same diversity, the '
+                'Shannon entropy measures the same on a logarithmic scale and the '
+                'Herfindahl-Hirschman index is the chance that two chart entries '
+                'share their genre (higher means less diverse). The slider sets '
+                'the number of days, weeks or months each point is averaged over.',
+                style=textstyle),
+        ], className='container_genres'),
+
+        html.Div([
+            html.H2('Genre Distribution for a Year')
+        ], className='title'),
+
+        html.Div([
+            dcc.Dropdown(
+                id='year-dropdown',
+                options=[{'label': year, 'value': year}
+                         for year in available_years],
+                value=initial_year,
+                clearable=False,
+                style=dropdown_style),
+            dcc.Graph(id='genre-bar-plot', figure=year_bar_fig),
+            html.Div(
+                'This bar chart provides the distribution of representation of all '
+                'found music genres for a given year.It is meant to provide a more '
+                'detailed look by showing all found genres, including a '
+                'representation for all not identified genres (in "Not Found").',
+                style=textstyle),
+        ], className='container_genres'),
+
+        html.Div([
+            html.H2('Genre Distribution for a Date Window and Rank Range')
+        ], className='title'),
+
+        # Div: The date window also applies to the rank ranges of the pie chart
+        html.Div([
+            dcc.DatePickerRange(
+                id='genre-date-range',
+                min_date_allowed=days[0].date(),
+                max_date_allowed=days[-1].date(),
+                start_date=days[0].date(),
+                end_date=days[-1].date(),
+                display_format='YYYY-MM-DD'),
+            dcc.RangeSlider(
+                id='genre-rank-range',
+                min=1, max=200, step=1,
+                value=[1, 200],
+                marks={rank: str(rank) for rank in (1, 50, 100, 150, 200)},
+                tooltip={'placement': 'bottom', 'always_visible': True}),
+            dcc.Graph(id='genre-window-bar-plot', figure=window_bar_fig),
+            html.Div(
+                'This bar chart shows the distribution of all genres for the chart '
+                'entries between two days and within a range of ranks, e.g. only '
+                'the top 10 of one summer. The selected days also apply to the '
+                'pie chart below.',
+                style=textstyle),
+        ], className='container_genres'),
+
+        html.Div([
+            html.H2('Distribution of a Genre\'s Representation by Rank and '
+                    'Rank ranges')
+        ], className='title'),
+
+        html.Div([
+            dcc.Dropdown(
+                id='genre-dropdown',
+                options=[{'label': genre, 'value': genre} 
+                         for genre in available_genres],
+                value=initial_genre,
+                clearable=False,
+                style=dropdown_style),
+
+            dcc.RangeSlider(
+                id='rank-tier-slider',
+                min=1, max=199, step=1,
+                value=initial_tiers,
+                pushable=1,
+                marks={rank: str(rank) for rank in (1, 50, 100, 150, 199)},
+                tooltip={'placement': 'bottom', 'always_visible': True}),
+            dcc.Graph(id='genre-pie-plot', figure=rank_pie_fig),
+            html.Div(
+                'This pie chart visualizes how different music genres are '
+                'distributed across chart rank ranges and whether certain genres '
+                'dominate specific rank ranges. The rank ranges are categorized '
+                'into three tiers: upper (1-66), mid (67-133), and lower '
+                '(134-200). Move the slider to change the last rank of the upper '
+                'and the mid tier.\n'
+                'The boxplot visualizes how different music genres are '
+                'distributed across chart ranks. It is meant to provide a more '
+                'detailed insight into the distribution of music genres across '
+                'ranks in contrast to the previous pie chart.',
+                style=textstyle),
+
+            dcc.Graph(id='genre-box-plot', figure=rank_box_fig),
+        ], className='container_genres')
+
+    ])
 
 # Define callback to update bar chart
 @app.callback(
     Output('genre-bar-plot', 'figure'),
     Input('year-dropdown', 'value')
 )
+@cached_callback
 def update_bar_chart(year):
     return generate_bar_chart(year)
 
-# Define callback for pie chart and box plot
+# Define callback to update the genre trend plot
 @app.callback(
-    [Output('genre-pie-plot', 'figure'),
-     Output('genre-box-plot', 'figure')],
+    Output('genre-trend-plot', 'figure'),
+    [Input('trend-threshold', 'value'),
+     Input('trend-window', 'value')]
+)
+@cached_callback
+def update_line_plot(threshold, window):
+    return generate_line_plot(threshold / 100, window)
+
+# Define callback to update the diversity plot
+@app.callback(
+    Output('genre-diversity-plot', 'figure'),
+    [Input('diversity-granularity', 'value'),
+     Input('diversity-measure', 'value'),
+     Input('diversity-window', 'value')]
+)
+@cached_callback
+def update_diversity_plot(granularity, measure, window):
+    return generate_diversity_plot(granularity, measure, window)
+
+# Define callback to update the bar chart of a date window and rank range
+@app.callback(
+    Output('genre-window-bar-plot', 'figure'),
+    [Input('genre-date-range', 'start_date'),
+     Input('genre-date-range', 'end_date'),
+     Input('genre-rank-range', 'value')]
+)
+@cached_callback
+def update_window_bar_chart(start_date, end_date, rank_range):
+    return generate_window_bar_chart(start_date, end_date, rank_range)
+
+# Define callback for pie chart
+@app.callback(
+    Output('genre-pie-plot', 'figure'),
+    [Input('genre-dropdown', 'value'),
+     Input('rank-tier-slider', 'value'),
+     Input('genre-date-range', 'start_date'),
+     Input('genre-date-range', 'end_date')]
+)
+@cached_callback
+def update_pie_chart(genre, tiers, start_date, end_date):
+    return generate_pie_chart(genre, tiers, start_date, end_date)
+
+# Define callback for box plot
+@app.callback(
+    Output('genre-box-plot', 'figure'),
     Input('genre-dropdown', 'value')
 )
-def update_figures(genre):
-    pie_chart = generate_pie_chart(genre)
-    box_plot = generate_boxplot(genre)
-    return pie_chart, box_plot
+@cached_callback
+def update_box_plot(genre):
+    return generate_boxplot(genre)
+
+# Genre diversity series for reporting, e.g. /api/genres/diversity?granularity=week&window=4
+@app.server.route('/api/genres/diversity')
+def diversity_api():
+    granularity = request.args.get('granularity', 'month')
+    try:
+        window = int(request.args.get('window', 1))
+        series = diversity_series(granularity, window)
+    except ValueError as e:
+        return {'error': str(e)}, 400
+
+    series.index = series.index.astype(str)
+    return {
+        'data_version': data_version(),
+        'granularity': granularity,
+        'window': window,
+        'series': series.rename_axis('period').reset_index().to_dict(orient='records'),
+    }
@@ -1,37 +1,18 @@
 # Imports
-import io
-import base64
-from pathlib import Path
 from collections import Counter
 import pandas as pd
 import plotly.express as px
 from dash import dcc, html, Input, Output
 from plotly.subplots import make_subplots
-import plotly.graph_objects as go
-from wordcloud import WordCloud
-from sklearn.feature_extraction.text import CountVectorizer
-import nltk
-from nltk.corpus import stopwords
 from app.app import app
+from app.figure_cache import cached_callback
+from app.lazy import load_per_version
+from app.datasets import get_dataset, data_version
+from app.wordclouds import get_wordclouds, wordcloud_url
 
-# Read the data
-data_path = Path(__file__).resolve().parents[2] / 'data' / 'final_data' / 'all_locations_with_polarity_and_spotify.csv'
-df = pd.read_csv(data_path)
-
-# Convert 'first_appearance' column to datetime format
-df['first_appearance'] = pd.to_datetime(df['first_appearance'], errors='coerce')
-
-# Extract all years from first_appearance
-all_years = sorted(df['first_appearance'].dt.year.unique())
-
-# Extract all artists and get the top 30 based on appearances for top 30 dropdown and visualisation
-artists_list = [artist.strip() for artists in df['artist_names'] for artist in artists.split(',')]
-artist_counts = Counter(artists_list)
-top_30_artists = [artist for artist, _ in artist_counts.most_common(30)]
-
-# Get stop words for wordclouds
-nltk.download('stopwords')
-stop_words = set(stopwords.words('english'))
+# The data with 'first_appearance' as datetime, parsed on first use
+def load_data():
+    return get_dataset('lyrics')
 
 # Style definitions for dropdown and textstyle
 dropdown_style = {
@@ -53,121 +34,133 @@ textstyle={
     'font-family': 'Arial, sans-serif'
 }
 
-# Layout for sections
-layout = html.Div([
-
-    html.Div([
-        html.H2("What is the contribution of positive and negative words (polarity) in english-language songs at different locations and different artists and how did it evolve on Spotify since 2017?")
-    ], className='question'),
-
-    # Div: Dropdown for charts area selection
-    html.Div([
-        dcc.Dropdown(
-            id='location-dropdown',
-            options=[{'label': loc, 'value': loc} for loc in df['location'].unique()],
-            value='Global',
-            searchable=False,
-            style=dropdown_style
-        ),
-    ], className='container_polarity_location_dropdown'),
-
-    html.Div([
-        html.H2("Wordcloud from Lyrics per Year (Single words, Bigram, Trigram)")
-    ], className='title'),
-
-    # Div: Dropdown, visualisation and description for the wordcloud
-    html.Div([
-        dcc.Dropdown(
-            id='year-dropdown-wordcloud',
-            options=[{'label': str(year), 'value': str(year)} for year in all_years],
-            value='2020',
-            searchable=False,
-            style=dropdown_style),
-        dcc.Graph(id='wordcloud-graphs'),
-        html.Div(
-            "To give you a good insight on the lyrics, you can look at the most used single words, bigrams (two words used together) and trigrams (three words used together).",
-            style=textstyle)
-    ], className='container_polarity'),
-
-    html.Div([
-        html.H2("Polarity of Songs per Month per Year")
-    ], className='title'),
-
-    # Div: Dropdown, visualisation and description for the polarity of songs per month per year
-    html.Div([
-        dcc.Dropdown(
-            id='year-dropdown',
-            options=[{'label': str(year), 'value': str(year)} for year in all_years],
-            value='2020',
-            searchable=False,
-            style=dropdown_style),
-        dcc.Graph(id='polarity-graph'),
-        html.Div(
-            "This plot shows the distribution of the polarity over all months per year. You can adjust the year in the drodown. "
-            "The mean polarity of all locations is approaching zero for all years. Global and Usa both have a maximum polarity "
-            "of around 0.8. The Uk has a maximum polarity of 0.9. All three locations have the same minimum polarity with "
-            "-0.79, which is probably due to having the same song in their charts.",
-            style=textstyle)
-    ], className='container_polarity'),
+# Layout for sections, built on the first visit of the page
+@load_per_version(data_version)
+def get_layout():
+    df = load_data()
+
+    # Extract all years from first_appearance
+    all_years = sorted(df['first_appearance'].dt.year.unique())
+
+    # Extract all artists and get the top 30 based on appearances for top 30 dropdown and visualisation
+    artists_list = [artist.strip() for artists in df['artist_names'] for artist in artists.split(',')]
+    artist_counts = Counter(artists_list)
+    top_30_artists = [artist for artist, _ in artist_counts.most_common(30)]
+
+    return html.Div([
+
+        html.Div([
+            html.H2("What is the contribution of positive and negative words (polarity) in english-language songs at different locations and different artists and how did it evolve on Spotify since 2017?")
+        ], className='question'),
+
+        # Div: Dropdown for charts area selection
+        html.Div([
+            dcc.Dropdown(
+                id='location-dropdown',
+                options=[{'label': loc, 'value': loc} for loc in df['location'].unique()],
+                value='Global',
+                searchable=False,
+                style=dropdown_style
+            ),
+        ], className='container_polarity_location_dropdown'),
+
+        html.Div([
+            html.H2("Wordcloud from Lyrics per Year (Single words, Bigram, Trigram)")
+        ], className='title'),
+
+        # Div: Dropdown, visualisation and description for the wordcloud
+        html.Div([
+            dcc.Dropdown(
+                id='year-dropdown-wordcloud',
+                options=[{'label': str(year), 'value': str(year)} for year in all_years],
+                value='2020',
+                searchable=False,
+                style=dropdown_style),
+            dcc.Graph(id='wordcloud-graphs'),
+            html.Div(
+                "To give you a good insight on the lyrics, you can look at the most used single words, bigrams (two words used together) and trigrams (three words used together).",
+                style=textstyle)
+        ], className='container_polarity'),
+
+        html.Div([
+            html.H2("Polarity of Songs per Month per Year")
+        ], className='title'),
+
+        # Div: Dropdown, visualisation and description for the polarity of songs per month per year
+        html.Div([
+            dcc.Dropdown(
+                id='year-dropdown',
+                options=[{'label': str(year), 'value': str(year)} for year in all_years],
+                value='2020',
+                searchable=False,
+                style=dropdown_style),
+            dcc.Graph(id='polarity-graph'),
+            html.Div(
+                "This plot shows the distribution of the polarity over all months per year. You can adjust the year in the drodown. "
+                "The mean polarity of all locations is approaching zero for all years. Global and Usa both have a maximum polarity "
+                "of around 0.8. The Uk has a maximum polarity of 0.9. All three locations have the same minimum polarity with "
+                "-0.79, which is probably due to having the same song in their charts.",
+                style=textstyle)
+        ], className='container_polarity'),
     
-    html.Div([
-        html.H2("Polarity, Song Duration, and Chart Days of Top 50 Artists per Year")
-    ], className='title'),
-
-    # Div: Dropdown, visualisation and description for the polarity, duration, and chart days of top 50 artists per year
-    html.Div([
-        dcc.Dropdown(
-            id='year-dropdown-top50',
-            options=[{'label': str(year), 'value': str(year)} for year in all_years],
-            value='2020',
-            searchable=False,
-            style=dropdown_style),
-        dcc.Graph(id='polarity-graph-top-50'),
-        html.Div(
-            "You can compare the different polarities with the duration of a song and the days a song stayed in the charts (size of the bubbles).",
-            style=textstyle)
-    ], className='container_polarity'),
+        html.Div([
+            html.H2("Polarity, Song Duration, and Chart Days of Top 50 Artists per Year")
+        ], className='title'),
+
+        # Div: Dropdown, visualisation and description for the polarity, duration, and chart days of top 50 artists per year
+        html.Div([
+            dcc.Dropdown(
+                id='year-dropdown-top50',
+                options=[{'label': str(year), 'value': str(year)} for year in all_years],
+                value='2020',
+                searchable=False,
+                style=dropdown_style),
+            dcc.Graph(id='polarity-graph-top-50'),
+            html.Div(
+                "You can compare the different polarities with the duration of a song and the days a song stayed in the charts (size of the bubbles).",
+                style=textstyle)
+        ], className='container_polarity'),
     
-    html.Div([
-        html.H2("Polarity of Songs from Top 30 Artists over all Years")
-    ], className='title'),
-
-    # Div: Dropdown, visualisation and description for the polarity of songs from top 30 artists over all years
-    html.Div([
-        dcc.Dropdown(
-            id='artist-dropdown',
-            options=[{'label': artist, 'value': artist} for artist in top_30_artists],
-            multi=True,
-            value=[top_30_artists[0], top_30_artists[1]],
-            searchable=False,
-            style=dropdown_style
-        ),
-        dcc.Graph(id='polarity-graph-artist'),
-        html.Div(
-            "The top 30 artists per location based on appearing most often in the charts are available to compare their polarity.",
-            style=textstyle)
-    ], className='container_polarity'),
-
-    html.Div([
-        html.H2("Top 5 Songs with Highest and Lowest Polarity per Year")
-    ], className='title'),
-
-    # Div: Dropdown, visualisation and description for the top 5 songs with highest and lowest polarity per year
-    html.Div([
-
-        dcc.Dropdown(
-            id='year-dropdown-top5',
-            options=[{'label': str(year), 'value': str(year)} for year in all_years],
-            value='2020',
-            searchable=False,
-            style=dropdown_style),
-        dcc.Graph(id='polarity-graph-top-bottom'),
+        html.Div([
+            html.H2("Polarity of Songs from Top 30 Artists over all Years")
+        ], className='title'),
+
+        # Div: Dropdown, visualisation and description for the polarity of songs from top 30 artists over all years
+        html.Div([
+            dcc.Dropdown(
+                id='artist-dropdown',
+                options=[{'label': artist, 'value': artist} for artist in top_30_artists],
+                multi=True,
+                value=[top_30_artists[0], top_30_artists[1]],
+                searchable=False,
+                style=dropdown_style
+            ),
+            dcc.Graph(id='polarity-graph-artist'),
             html.Div(
-            "Visualisation of top 5 positive and negative (polarity) songs per year.",
-            style=textstyle)
-    ], className='container_polarity'),
+                "The top 30 artists per location based on appearing most often in the charts are available to compare their polarity.",
+                style=textstyle)
+        ], className='container_polarity'),
+
+        html.Div([
+            html.H2("Top 5 Songs with Highest and Lowest Polarity per Year")
+        ], className='title'),
+
+        # Div: Dropdown, visualisation and description for the top 5 songs with highest and lowest polarity per year
+        html.Div([
+
+            dcc.Dropdown(
+                id='year-dropdown-top5',
+                options=[{'label': str(year), 'value': str(year)} for year in all_years],
+                value='2020',
+                searchable=False,
+                style=dropdown_style),
+            dcc.Graph(id='polarity-graph-top-bottom'),
+                html.Div(
+                "Visualisation of top 5 positive and negative (polarity) songs per year.",
+                style=textstyle)
+        ], className='container_polarity'),
     
-])
+    ])
 
 # Callbacks to update the visualisations
 # Callback for the wordcloud
@@ -176,88 +169,35 @@ layout = html.Div([
     [Input('year-dropdown-wordcloud', 'value'),
      Input('location-dropdown', 'value')]
 )
+@cached_callback
 def update_wordclouds(selected_year, selected_location):
-    # Filter the selected year and location
-    df_filtered = df[(df['first_appearance'].dt.year == int(selected_year)) & (df['location'] == selected_location)]
-    
-    # Get the lyrics for the selected year
-    lyrics = df_filtered['lyrics'].dropna().astype(str).tolist()
-
-    # Remove the stop words from the lyrics
-    filtered_lyrics = [' '.join([word for word in lyric.split() if word.lower() not in stop_words]) for lyric in lyrics]
-
-    # Creating three different wordclouds to align them in one row and to remove the axes for every one
-    # Wordcloud one for single words
-    wordcloud_1 = WordCloud(
-        colormap='Spectral',
-        mode="RGBA",
-        background_color=None,
-        max_words=50,
-        width=400,
-        height=400,
-    ).generate(' '.join(filtered_lyrics))
-    
-    # Convert the first wordcloud image to base64
-    img_byte_arr_1 = io.BytesIO()
-    wordcloud_1.to_image().save(img_byte_arr_1, format='PNG')
-    img_byte_arr_1.seek(0)
-    img_base64_1 = base64.b64encode(img_byte_arr_1.getvalue()).decode('utf-8')
-
-    # Wordcloud two for bigrams
-    vectorizer_bigram = CountVectorizer(ngram_range=(2, 2), stop_words='english')
-    bigrams = vectorizer_bigram.fit_transform(filtered_lyrics)
-    bigram_counts = bigrams.sum(axis=0).A1
-    bigram_terms = vectorizer_bigram.get_feature_names_out()
-    bigram_freq = dict(zip(bigram_terms, bigram_counts))
-
-    wordcloud_2 = WordCloud(
-        colormap='Spectral',
-        background_color=None,
-        mode="RGBA",
-        max_words=50,
-        width=400,
-        height=400,
-    ).generate_from_frequencies(bigram_freq)
-    
-    # Convert the second wordcloud image to base64
-    img_byte_arr_2 = io.BytesIO()
-    wordcloud_2.to_image().save(img_byte_arr_2, format='PNG')
-    img_byte_arr_2.seek(0)
-    img_base64_2 = base64.b64encode(img_byte_arr_2.getvalue()).decode('utf-8')
-
-    # Wordcloud three for trigrams
-    vectorizer_trigram = CountVectorizer(ngram_range=(3, 3), stop_words='english')
-    trigrams = vectorizer_trigram.fit_transform(filtered_lyrics)
-    trigram_counts = trigrams.sum(axis=0).A1
-    trigram_terms = vectorizer_trigram.get_feature_names_out()
-    trigram_freq = dict(zip(trigram_terms, trigram_counts))
-
-    wordcloud_3 = WordCloud(
-        colormap='Spectral',
-        background_color=None,
-        mode="RGBA",
-        max_words=75,
-        width=400,
-        height=400,
-    ).generate_from_frequencies(trigram_freq)
-    
-    # Convert the third wordcloud image to base64
-    img_byte_arr_3 = io.BytesIO()
-    wordcloud_3.to_image().save(img_byte_arr_3, format='PNG')
-    img_byte_arr_3.seek(0)
-    img_base64_3 = base64.b64encode(img_byte_arr_3.getvalue()).decode('utf-8')
+    df = load_data()
 
     # Create a subplot with three wordcloud images (Subplot is from ChatGPT)
     fig = make_subplots(rows=1, cols=3,)
 
-    # Add the first WordCloud image (single)
-    fig.add_trace(go.Image(source=f'data:image/png;base64,{img_base64_1}'),row=1, col=1)
-
-    # Add the second wordcloud image (bigram)
-    fig.add_trace(go.Image(source=f'data:image/png;base64,{img_base64_2}'),row=1, col=2)
-
-    # Add the third wordcloud image (trigram)
-    fig.add_trace(go.Image(source=f'data:image/png;base64,{img_base64_3}'),row=1, col=3)
+    # Songs of the selected year and location, a wordcloud needs at least one
+    has_songs = ((df['first_appearance'].dt.year == int(selected_year))
+                 & (df['location'] == selected_location)).any()
+    if has_songs:
+        # Rendered wordclouds from the cache, see app/wordclouds.py
+        paths = get_wordclouds(selected_year, selected_location)
+
+        # Add the single word, bigram and trigram wordclouds, referenced by url
+        # so the browser loads and caches the images itself
+        for col, n in enumerate((1, 2, 3), start=1):
+            fig.add_layout_image(
+                source=wordcloud_url(paths[n]),
+                xref='x domain', yref='y domain',
+                x=0.5, y=0.5, sizex=1, sizey=1,
+                xanchor='center', yanchor='middle',
+                sizing='contain',
+                row=1, col=col)
+    else:
+        fig.add_annotation(
+            text=f'No lyrics for {selected_location} in {selected_year}',
+            xref='paper', yref='paper', x=0.5, y=0.5,
+            showarrow=False, font=dict(size=18, color='#f2f2f2'))
 
     # Adjust the layout
     fig.update_layout(
@@ -284,7 +224,10 @@ def update_wordclouds(selected_year, selected_location):
     [Input('year-dropdown', 'value'),
      Input('location-dropdown', 'value')]
 )
+@cached_callback
 def update_violin_plot(selected_year, selected_location):
+    df = load_data()
+
     # Filter the selected year and location
     df_filtered = df[(df['first_appearance'].dt.year == int(selected_year)) & (df['location'] == selected_location)]
     
@@ -329,12 +272,15 @@ def update_violin_plot(selected_year, selected_location):
     [Input('year-dropdown-top50', 'value'),
      Input('location-dropdown', 'value')]
 )
+@cached_callback
 def update_top50_scatter(selected_year, selected_location):
+    df = load_data()
+
     # Filter the selected year and location
     df_filtered = df[(df['first_appearance'].dt.year == int(selected_year)) & (df['location'] == selected_location)]
     
     # Get the top 50 artists based on chart days
-    grouped_df = df_filtered.groupby('artist_names').agg({'polarity': 'mean', 'duration_seconds': 'mean', 'max_days_on_chart': 'sum'}).reset_index()
+    grouped_df = df_filtered.groupby('artist_names', observed=True).agg({'polarity': 'mean', 'duration_seconds': 'mean', 'max_days_on_chart': 'sum'}).reset_index()
     top_50_artists = grouped_df.nlargest(50, 'max_days_on_chart')
 
     # Visualize as a scatter plot
@@ -366,7 +312,10 @@ def update_top50_scatter(selected_year, selected_location):
     [Input('year-dropdown-top5', 'value'),
      Input('location-dropdown', 'value')]
 )
+@cached_callback
 def update_top5_songs(selected_year, selected_location):
+    df = load_data()
+
     # Filter the selected year and location
     df_filtered = df[(df['first_appearance'].dt.year == int(selected_year)) & (df['location'] == selected_location)].copy()
     
@@ -441,12 +390,17 @@ def update_top5_songs(selected_year, selected_location):
     [Input('artist-dropdown', 'value'),
      Input('location-dropdown', 'value')]
 )
+@cached_callback
 def update_artist_polarity(selected_artists, selected_location):
+    df = load_data()
+
     # Get all rows which include one top 30 artist and selected location
     def match_artist(artist_names):
         return any(artist in [a.strip() for a in artist_names.split(',')] for artist in selected_artists)
 
-    df_selected = df[df['artist_names'].apply(match_artist) & (df['location'] == selected_location)]
+    # Artist names are categorical, so every distinct name is only checked once
+    matching = [names for names in df['artist_names'].cat.categories if match_artist(names)]
+    df_selected = df[df['artist_names'].isin(matching) & (df['location'] == selected_location)]
         
     # Get the main artist (first one) for the visualisation (space reason)
     def get_main_artist(artist_names):
@@ -462,7 +416,7 @@ def update_artist_polarity(selected_artists, selected_location):
     df_selected['year_month'] = df_selected['first_appearance'].dt.to_period('M').astype(str)
     
     # Group by 'year_month' and 'main_artist', and calculate the average polarity
-    polarity_by_month = df_selected.groupby(['year_month', 'main_artist'])['polarity'].mean().reset_index()
+    polarity_by_month = df_selected.groupby(['year_month', 'main_artist'], observed=True)['polarity'].mean().reset_index()
     
     # Visualize as a line plot
     fig = px.line(polarity_by_month, x='year_month', y='polarity', color='main_artist', labels={'year_month': 'Date', 'polarity': 'Polarity', 'main_artist': 'Artist'})
@@ -1,107 +1,123 @@
 # Imports
-from pathlib import Path
 from dash import html, dcc, Input, Output
 import plotly.express as px
-import pandas as pd
 from app.app import app
+from app.figure_cache import cached_callback
+from app.lazy import load_per_version
+from app.datasets import get_dataset, data_version
 
-# Read the data
-data_path = Path(__file__).resolve(
-).parents[2] / 'data' / 'final_data' / 'global_17-24_with_spotifyextras.csv'
-df = pd.read_csv(data_path)
 
-# Pie Chart
-bin_counts = df['relase-chart_days_bins'].value_counts().reindex(
-    ['0 days', '<1 week', '1-2 weeks', '2-3 weeks', '3-4 weeks', '4+ weeks']
-)
+# The data with the time baskets as ordered category, parsed on first use
+def load_data():
+    return get_dataset('charts_summary')
 
-pie_release = px.pie(
-    names=bin_counts.index,
-    values=bin_counts.values,
-    color=bin_counts.index,
-    color_discrete_sequence=px.colors.qualitative.Vivid)
-
-pie_release.update_layout(height=500)
-pie_release.update_traces(textinfo='percent+label', hole=0.6)
-pie_release.update_layout(template="plotly_dark",
-                          showlegend=False,
-                          xaxis_title_font=dict(family='Arial', weight='bold'),
-                          yaxis_title_font=dict(family='Arial', weight='bold'),
-                          paper_bgcolor="rgba(20,20,20,0.5)",
-                          plot_bgcolor="rgba(20,20,20,0.5)"
-)
 
-# Bar chart
-mean_values = df.groupby('relase-chart_days_bins')[
-    ['max_days_on_chart', 'total_streams', 'min_peak_rank']
-].mean().reindex(['0 days', '<1 week', '1-2 weeks', '2-3 weeks', '3-4 weeks', '4+ weeks'])
-
-overall_means = df[['max_days_on_chart',
-                    'total_streams', 'min_peak_rank']].mean()
-
-bar_release = px.bar(
-    x=mean_values.index,
-    y=mean_values['max_days_on_chart'],
-    text=mean_values['max_days_on_chart'].round(1),
-    labels={'x': 'Time Baskets', 'y': 'Average Max Days on Chart'},
-    color=mean_values.index,
-    color_discrete_sequence=px.colors.qualitative.Vivid
-)
+# Mean values per time basket and overall, shared by the bar chart and its callback
+@load_per_version(data_version)
+def load_means():
+    df = load_data()
 
-bar_release.add_hline(
-    y=overall_means['max_days_on_chart'],
-    line_dash="dash",
-    line_color="red",
-    annotation_text=f"Overall Mean: {overall_means['max_days_on_chart']:.1f}",
-    annotation_position="top left"
-)
+    mean_values = df.groupby('relase-chart_days_bins', observed=False)[
+        ['max_days_on_chart', 'total_streams', 'min_peak_rank']
+    ].mean().reindex(['0 days', '<1 week', '1-2 weeks', '2-3 weeks', '3-4 weeks', '4+ weeks'])
 
-bar_release.update_traces(textposition='outside')
-bar_release.update_layout(
-    showlegend=False,
-    xaxis_title="Time Baskets",
-    yaxis_title="Average Max Days on Chart",
-    template="plotly_dark",
-    xaxis_title_font=dict(family='Arial', weight='bold'),
-    yaxis_title_font=dict(family='Arial', weight='bold'),
-    paper_bgcolor="rgba(20,20,20,0.5)",
-    plot_bgcolor="rgba(20,20,20,0.5)"
-)
+    overall_means = df[['max_days_on_chart',
+                        'total_streams', 'min_peak_rank']].mean()
 
-# Violin chart
-violin_release = px.violin(
-    df,
-    x='relase-chart_days_bins',
-    y='max_days_on_chart',
-    box=True,
-    points='all',
-    color='relase-chart_days_bins',
-    color_discrete_sequence=px.colors.qualitative.Vivid,
-    category_orders={
-        'relase-chart_days_bins': ['0 days', '<1 week', '1-2 weeks', '2-3 weeks', '3-4 weeks', '4+ weeks']
-    }
-)
+    return mean_values, overall_means
 
-overall_median = df['max_days_on_chart'].median()
-violin_release.add_hline(
-    y=overall_median,
-    line_dash="dash",
-    line_color="red",
-    annotation_text=f"Overall Median: {overall_median:.1f}",
-    annotation_position="top left"
-)
 
-violin_release.update_layout(
-    showlegend=False,
-    xaxis_title="Time Baskets",
-    yaxis_title="Max Days on Chart",
-    yaxis=dict(range=[0, 200]),
-    template="plotly_dark",
-    xaxis_title_font=dict(family='Arial', weight='bold'),
-    yaxis_title_font=dict(family='Arial', weight='bold'),
-    paper_bgcolor="rgba(20,20,20,0.5)",
-    plot_bgcolor="rgba(20,20,20,0.5)"
-)
+def build_figures():
+    df = load_data()
+    mean_values, overall_means = load_means()
+
+    # Pie Chart
+    bin_counts = df['relase-chart_days_bins'].value_counts().reindex(
+        ['0 days', '<1 week', '1-2 weeks', '2-3 weeks', '3-4 weeks', '4+ weeks']
+    )
+
+    pie_release = px.pie(
+        names=bin_counts.index,
+        values=bin_counts.values,
+        color=bin_counts.index,
+        color_discrete_sequence=px.colors.qualitative.Vivid)
+
+    pie_release.update_layout(height=500)
+    pie_release.update_traces(textinfo='percent+label', hole=0.6)
+    pie_release.update_layout(template="plotly_dark",
+                              showlegend=False,
+                              xaxis_title_font=dict(family='Arial', weight='bold'),
+                              yaxis_title_font=dict(family='Arial', weight='bold'),
+                              paper_bgcolor="rgba(20,20,20,0.5)",
+                              plot_bgcolor="rgba(20,20,20,0.5)"
+    )
+
+    # Bar chart
+    bar_release = px.bar(
+        x=mean_values.index,
+        y=mean_values['max_days_on_chart'],
+        text=mean_values['max_days_on_chart'].round(1),
+        labels={'x': 'Time Baskets', 'y': 'Average Max Days on Chart'},
+        color=mean_values.index,
+        color_discrete_sequence=px.colors.qualitative.Vivid
+    )
+
+    bar_release.add_hline(
+        y=overall_means['max_days_on_chart'],
+        line_dash="dash",
+        line_color="red",
+        annotation_text=f"Overall Mean: {overall_means['max_days_on_chart']:.1f}",
+        annotation_position="top left"
+    )
+
+    bar_release.update_traces(textposition='outside')
+    bar_release.update_layout(
+        showlegend=False,
+        xaxis_title="Time Baskets",
+        yaxis_title="Average Max Days on Chart",
+        template="plotly_dark",
+        xaxis_title_font=dict(family='Arial', weight='bold'),
+        yaxis_title_font=dict(family='Arial', weight='bold'),
+        paper_bgcolor="rgba(20,20,20,0.5)",
+        plot_bgcolor="rgba(20,20,20,0.5)"
+    )
+
+    # Violin chart
+    violin_release = px.violin(
+        df,
+        x='relase-chart_days_bins',
+        y='max_days_on_chart',
+        box=True,
+        points='all',
+        color='relase-chart_days_bins',
+        color_discrete_sequence=px.colors.qualitative.Vivid,
+        category_orders={
+            'relase-chart_days_bins': ['0 days', '<1 week', '1-2 weeks', '2-3 weeks', '3-4 weeks', '4+ weeks']
+        }
+    )
+
+    overall_median = df['max_days_on_chart'].median()
+    violin_release.add_hline(
+        y=overall_median,
+        line_dash="dash",
+        line_color="red",
+        annotation_text=f"Overall Median: {overall_median:.1f}",
+        annotation_position="top left"
+    )
+
+    violin_release.update_layout(
+        showlegend=False,
+        xaxis_title="Time Baskets",
+        yaxis_title="Max Days on Chart",
+        yaxis=dict(range=[0, 200]),
+        template="plotly_dark",
+        xaxis_title_font=dict(family='Arial', weight='bold'),
+        yaxis_title_font=dict(family='Arial', weight='bold'),
+        paper_bgcolor="rgba(20,20,20,0.5)",
+        plot_bgcolor="rgba(20,20,20,0.5)"
+    )
+
+    return pie_release, bar_release, violin_release
 
 # Style definition for text style
 textstyle = {
@@ -115,72 +131,76 @@ textstyle = {
     'font-family': 'Arial, sans-serif'
 }
 
-# Layout for the sections
-layout = html.Div([
-
-    html.Div([
-        html.H2("How long does it take for a song to enter the charts after its release and is there a connection to the length of time the song is in the charts on Spotify?")
-    ], className='question'),
-
-    html.Div([
-        html.H2("Time between Release and Entering the Charts")
-    ], className='title'),
-
-    html.Div([
-        dcc.Graph(figure=pie_release),
-        html.Div(
-            "While more than half of all songs chart on the same day, there's also a surprising number that take longer.\n"
-            "Almost 20% only get noticed four or more weeks later.\n"
-            "It shows that there are really two main ways a song can blow up:\n"
-            "Either it becomes a hit right away thanks to the hype around a famous artist, or it slowly picks up attention over time.\n"
-            "But is there an advantage to one path over the other?\n\n"
-            "We’ll take a closer look at this in terms of the following attributes:\n\n"
-            "Max Days on Chart: The total number of days a song stayed in the charts.\n"
-            "Total Streams: The total number of streams a song accumulated while in the charts.\n"
-            "Rank: The highest chart position a song reached (lower = better).",
-
-            style=textstyle)
-    ], className='container_release_pie'),
-
-    html.Div([
-        html.H2("Max days in charts, total streams of charted songs per time interval and minimum peak rank in charts per time interval")
-    ], className='title'),
-
-    # Div: Dropdown with bar chart and description
-    html.Div([
-        dcc.Dropdown(
-            id='metric-dropdown',
-            options=[
-                {'label': 'Max days in charts', 'value': 'max_days_on_chart'},
-                {'label': 'Total streams of charted songs per time interval',
-                    'value': 'total_streams'},
-                {'label': 'Minimum rank in charts per time interval', 'value': 'min_peak_rank'},],
-            value='min_peak_rank',
-            style={
-                'backgroundColor': 'white',
-                'color': 'black',
-                'font-size': '18px',
-                'border-radius': '5px',
-                'font-weight': 'bold'}),
-        dcc.Graph(id='bar-release', figure=bar_release),
-        html.Div(
-            "This bar plot shows that, for each of the three attributes, songs that took longer to first appear on the chart generally stayed in the charts longer.",
-            style=textstyle)
-    ], className='container_release'),
-
-    html.Div([
-        html.H2("Distribution of Max Days in Charts without Outliers")
-    ], className='title'),
-
-    # Div: Violin Chart with description
-    html.Div([
-        dcc.Graph(figure=violin_release),
-        html.Div(
-            "This violin chart also shows the distribution of the data, revealing that many songs which enter the charts instantly also drop out in a matter of days.",
-            style=textstyle)
-    ], className='container_release'),
-
-])
+# Layout for the sections, built on the first visit of the page
+@load_per_version(data_version)
+def get_layout():
+    pie_release, bar_release, violin_release = build_figures()
+
+    return html.Div([
+
+        html.Div([
+            html.H2("How long does it take for a song to enter the charts after its release and is there a connection to the length of time the song is in the charts on Spotify?")
+        ], className='question'),
+
+        html.Div([
+            html.H2("Time between Release and Entering the Charts")
+        ], className='title'),
+
+        html.Div([
+            dcc.Graph(figure=pie_release),
+            html.Div(
+                "While more than half of all songs chart on the same day, there's also a surprising number that take longer.\n"
+                "Almost 20% only get noticed four or more weeks later.\n"
+                "It shows that there are really two main ways a song can blow up:\n"
+                "Either it becomes a hit right away thanks to the hype around a famous artist, or it slowly picks up attention over time.\n"
+                "But is there an advantage to one path over the other?\n\n"
+                "We’ll take a closer look at this in terms of the following attributes:\n\n"
+                "Max Days on Chart: The total number of days a song stayed in the charts.\n"
+                "Total Streams: The total number of streams a song accumulated while in the charts.\n"
+                "Rank: The highest chart position a song reached (lower = better).",
+
+                style=textstyle)
+        ], className='container_release_pie'),
+
+        html.Div([
+            html.H2("Max days in charts, total streams of charted songs per time interval and minimum peak rank in charts per time interval")
+        ], className='title'),
+
+        # Div: Dropdown with bar chart and description
+        html.Div([
+            dcc.Dropdown(
+                id='metric-dropdown',
+                options=[
+                    {'label': 'Max days in charts', 'value': 'max_days_on_chart'},
+                    {'label': 'Total streams of charted songs per time interval',
+                        'value': 'total_streams'},
+                    {'label': 'Minimum rank in charts per time interval', 'value': 'min_peak_rank'},],
+                value='min_peak_rank',
+                style={
+                    'backgroundColor': 'white',
+                    'color': 'black',
+                    'font-size': '18px',
+                    'border-radius': '5px',
+                    'font-weight': 'bold'}),
+            dcc.Graph(id='bar-release', figure=bar_release),
+            html.Div(
+                "This bar plot shows that, for each of the three attributes, songs that took longer to first appear on the chart generally stayed in the charts longer.",
+                style=textstyle)
+        ], className='container_release'),
+
+        html.Div([
+            html.H2("Distribution of Max Days in Charts without Outliers")
+        ], className='title'),
+
+        # Div: Violin Chart with description
+        html.Div([
+            dcc.Graph(figure=violin_release),
+            html.Div(
+                "This violin chart also shows the distribution of the data, revealing that many songs which enter the charts instantly also drop out in a matter of days.",
+                style=textstyle)
+        ], className='container_release'),
+
+    ])
 
 # Callback to update the bar chart
 
@@ -189,7 +209,10 @@ layout = html.Div([
     Output('bar-release', 'figure'),
     [Input('metric-dropdown', 'value')]
 )
+@cached_callback
 def update_bar_release(selected_metric):
+    mean_values, overall_means = load_means()
+
     updated_bar_release = px.bar(
         x=mean_values.index,
         y=mean_values[selected_metric],
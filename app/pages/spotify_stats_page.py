@@ -1,6 +1,5 @@
 # Imports
 import re
-from pathlib import Path
 import dash_html_components as html
 import dash_core_components as dcc
 from dash.dependencies import Input, Output
@@ -10,6 +9,7 @@ from spotipy.cache_handler import CacheHandler
 import pandas as pd
 import plotly.express as px
 from app.app import app
+from app.datasets import get_dataset
 
 # Function for normalizing the track and artist names for matching
 def normalize_string(s):
@@ -20,7 +20,7 @@ def normalize_string(s):
 # Match the requested spotify data with the charts data from the df
 def match_tracks(spotify_tracks, df):
     df['normalized_track_name'] = df['track_name'].apply(normalize_string)
-    df['normalized_artists'] = df['artist_names'].apply(lambda x: [normalize_string(a) for a in x.split(',')])
+    df['normalized_artists'] = df['artist_names'].astype(str).apply(lambda x: [normalize_string(a) for a in x.split(',')])
 
     matched_years = []
 
@@ -35,9 +35,9 @@ def match_tracks(spotify_tracks, df):
 
     return matched_years
 
-# Read the data
-data_path = Path(__file__).resolve().parents[2] / 'data' / 'final_data' / 'all_locations_with_polarity_and_spotify_without_duplicates.csv'
-df = pd.read_csv(data_path)
+# The data, parsed on first use
+def load_data():
+    return get_dataset('lyrics_unique')
 
 # Spotify API credentials
 SPOTIPY_CLIENT_ID = '213250a911734e19ba80a69269f564e4'
@@ -173,6 +173,7 @@ layout = html.Div([
 def fetch_top_tracks_and_bubble_chart(top_n, time_range):
     # Fetch user's top tracks based on the dropdown selection
     try:
+        df = load_data()
         results = sp.current_user_top_tracks(limit=int(top_n), time_range=time_range)
         top_tracks = results['items']
         
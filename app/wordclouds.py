@@ -0,0 +1,396 @@
+# Imports
+import os
+import re
+import shutil
+import argparse
+import threading
+import multiprocessing
+from io import BytesIO
+from concurrent.futures import Future, ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from PIL import Image
+from wordcloud import WordCloud
+from app.lazy import load_per_version
+from app.datastore import DATA_DIR, atomic_write
+from app.ngrams import NgramIndex
+from app.datasets import get_dataset, get_lyrics, data_version
+
+# Folder of the rendered wordclouds of the polarity page, one folder per data
+# version. Absolute, the server resolves relative folders against the app
+# package instead of the working directory.
+WORDCLOUD_DIR = Path(os.environ.get('WORDCLOUD_CACHE_DIR', DATA_DIR / 'wordclouds')).resolve()
+
+# Folder names of the data versions
+VERSION_PATTERN = re.compile(r'[0-9a-f]{16}')
+
+# The n-gram orders of the wordclouds and the number of words shown of each
+NGRAMS = {1: 50, 2: 50, 3: 75}
+
+# Renderings of this worker that are in progress, by year and location
+_pending = {}
+_pending_lock = threading.Lock()
+_executor = None
+_executor_pid = None
+
+
+def wordcloud_path(year, location, n, version):
+    '''
+    Returns the cached png of a wordcloud.
+
+    Arguments:
+        year (str or int): The year of the first appearance of the songs.
+        location (str): The charts location, e.g. 'Global'.
+        n (int): The n-gram order, 1 for single words.
+        version (str): The data version the wordcloud is rendered from.
+
+    Returns:
+        Path: The png file.
+    '''
+    location = re.sub(r'[^A-Za-z0-9]+', '-', str(location))
+    return WORDCLOUD_DIR / version / f'{location}_{year}_{n}.png'
+
+
+def wordcloud_url(path):
+    '''
+    Returns the url of a cached png, served by the /wordclouds route of the
+    server. The url contains the data version, so browsers can keep the
+    image as long as they like.
+
+    Arguments:
+        path (Path): A png file in WORDCLOUD_DIR.
+
+    Returns:
+        str: The url of the png.
+    '''
+    return f'/wordclouds/{path.relative_to(WORDCLOUD_DIR).as_posix()}'
+
+
+def write_png(path, png):
+    with atomic_write(path) as tmp_path:
+        tmp_path.write_bytes(png)
+    return path
+
+
+@load_per_version(data_version)
+def load_lyrics_index():
+    '''
+    Counts the n-grams of all lyrics of the polarity page once per data
+    version, from the token ids of the lyrics store.
+
+    Returns:
+        dict: The 'index' of the lyrics and the 'years' and 'locations' of the
+        songs, one entry per row of the index.
+    '''
+    df = get_dataset('lyrics')
+    lyrics = get_lyrics('lyrics')
+    return {
+        'index': NgramIndex(lyrics.token_ids, lyrics.offsets, lyrics.vocabulary, max_n=max(NGRAMS)),
+        'years': df['first_appearance'].dt.year.to_numpy(),
+        'locations': df['location'].astype(str).to_numpy(),
+    }
+
+
+def wordcloud_frequencies(year, location):
+    '''
+    Returns the most frequent n-grams of the songs of a year and location.
+
+    Arguments:
+        year (str or int): The year of the first appearance of the songs.
+        location (str): The charts location, e.g. 'Global'.
+
+    Returns:
+        dict: Per n-gram order of NGRAMS the frequencies of its shown n-grams.
+    '''
+    lyrics = load_lyrics_index()
+    mask = (lyrics['years'] == int(year)) & (lyrics['locations'] == location)
+    return {n: lyrics['index'].frequencies(mask, n, top=max_words)
+            for n, max_words in NGRAMS.items()}
+
+
+def render_wordclouds(frequencies):
+    '''
+    Lays out the single word, bigram and trigram wordclouds.
+
+    Arguments:
+        frequencies (dict): Per n-gram order the frequencies of its n-grams,
+        as returned by wordcloud_frequencies.
+
+    Returns:
+        dict: The png of every n-gram order, transparent for orders without
+        n-grams.
+    '''
+    pngs = {}
+    for n, ngram_frequencies in frequencies.items():
+        if ngram_frequencies:
+            image = WordCloud(
+                colormap='Spectral',
+                mode="RGBA",
+                background_color=None,
+                max_words=NGRAMS[n],
+                width=400,
+                height=400,
+            ).generate_from_frequencies(ngram_frequencies).to_image()
+        else:
+            # WordCloud fails without words
+            image = Image.new('RGBA', (400, 400))
+
+        buffer = BytesIO()
+        image.save(buffer, format='PNG')
+        pngs[n] = buffer.getvalue()
+    return pngs
+
+
+def render_to_cache(frequencies, year, location, version):
+    '''
+    Renders the wordclouds of a year and location into the cache. Runs in the
+    process pool, which only lays out the counted n-grams.
+
+    Arguments:
+        frequencies (dict): Per n-gram order the frequencies of its n-grams.
+        year (str or int): The year of the first appearance of the songs.
+        location (str): The charts location.
+        version (str): The data version the files are stored under.
+
+    Returns:
+        list of Path: The written png files.
+    '''
+    return [write_png(wordcloud_path(year, location, n, version), png)
+            for n, png in render_wordclouds(frequencies).items()]
+
+
+def _get_executor():
+    # One pool per worker process, a forked gunicorn worker starts its own
+    global _executor, _executor_pid
+    with _pending_lock:
+        if _executor_pid != os.getpid():
+            _executor = None
+            _pending.clear()
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=int(os.environ.get('WORDCLOUD_WORKERS', 2)),
+                mp_context=multiprocessing.get_context('spawn'))
+            _executor_pid = os.getpid()
+        return _executor
+
+
+def _reset_executor(executor):
+    # Drop a broken pool, the next _get_executor starts a new one
+    global _executor
+    with _pending_lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False)
+
+
+def _render(render, frequencies, *args):
+    # Renders in the pool, a render process that died, e.g. killed for its
+    # memory, breaks the pool, which is replaced and the rendering retried once
+    executor = _get_executor()
+    try:
+        return executor.submit(render, frequencies, *args).result()
+    except BrokenProcessPool:
+        _reset_executor(executor)
+        return _get_executor().submit(render, frequencies, *args).result()
+
+
+def _paths(year, location, version):
+    return {n: wordcloud_path(year, location, n, version) for n in NGRAMS}
+
+
+def _from_cache(paths, key, count, render, *args):
+    # Renders missing files: the first request counts the n-grams and waits
+    # for their layout in the process pool, concurrent requests for the same
+    # files wait for the first one
+    if all(path.exists() for path in paths.values()):
+        return paths
+
+    # A forked worker forgets the pending renderings of its parent first
+    _get_executor()
+    with _pending_lock:
+        future = _pending.get(key)
+        first = future is None
+        if first:
+            future = _pending[key] = Future()
+    if first:
+        try:
+            future.set_result(_render(render, count(), *args))
+        except Exception as e:
+            future.set_exception(e)
+        finally:
+            _forget(key, future)
+    future.result()
+    return paths
+
+
+def _forget(key, future):
+    with _pending_lock:
+        if _pending.get(key) is future:
+            del _pending[key]
+
+
+def get_wordclouds(year, location):
+    '''
+    Returns the wordclouds of a year and location from the cache, rendering
+    them first if needed.
+
+    For a missing wordcloud the request counts the n-grams from the lyrics
+    index and waits while the process pool lays them out, so the slow layout
+    does not hold the GIL of the worker. Concurrent requests for the same
+    wordclouds wait for the same rendering.
+
+    Arguments:
+        year (str or int): The year of the first appearance of the songs.
+        location (str): The charts location, e.g. 'Global'.
+
+    Returns:
+        dict: The png file of every n-gram order of NGRAMS.
+    '''
+    version = data_version()
+    return _from_cache(_paths(year, location, version), (str(year), location, version),
+                       lambda: wordcloud_frequencies(year, location),
+                       render_to_cache, year, location, version)
+
+
+# The explicity classes of the explicity page wordclouds
+EXPLICITY = {'explicit': True, 'not_explicit': False}
+
+
+def explicity_path(name, version):
+    # The cached png of the wordcloud of an explicity class
+    return WORDCLOUD_DIR / version / f'explicity_{name}.png'
+
+
+def explicity_frequencies():
+    '''
+    Counts the words of the explicit and not explicit lyrics of the explicity
+    page from the token ids of the lyrics store, without joining the texts.
+
+    Returns:
+        dict: Per class of EXPLICITY the frequencies of its 200 most frequent
+        words, the number of words of the wordclouds.
+    '''
+    df = get_dataset('lyrics_unique')
+    lyrics = get_lyrics('lyrics_unique')
+    index = NgramIndex(lyrics.token_ids, lyrics.offsets, lyrics.vocabulary, max_n=1)
+    explicit = df['explicit'].to_numpy()
+    return {name: index.frequencies(explicit == flag, 1, top=200)
+            for name, flag in EXPLICITY.items()}
+
+
+def render_explicity_to_cache(frequencies, version):
+    '''
+    Renders the wordclouds of the explicity classes into the cache. Runs in
+    the process pool.
+
+    Arguments:
+        frequencies (dict): Per class the frequencies of its words.
+        version (str): The data version the files are stored under.
+
+    Returns:
+        list of Path: The written png files.
+    '''
+    paths = []
+    for name, class_frequencies in frequencies.items():
+        if class_frequencies:
+            wordcloud = WordCloud(width=1000, height=1000, colormap='Spectral')
+            image = wordcloud.generate_from_frequencies(class_frequencies).to_image()
+        else:
+            # WordCloud fails without words, a class without lyrics stays black
+            image = Image.new('RGB', (1000, 1000))
+        buffer = BytesIO()
+        image.save(buffer, format='PNG')
+        paths.append(write_png(explicity_path(name, version), buffer.getvalue()))
+    return paths
+
+
+def get_explicity_wordclouds():
+    '''
+    Returns the wordclouds of the explicity page from the cache, rendering
+    them in the process pool if they were not built in advance.
+
+    Returns:
+        dict: The png file of every class of EXPLICITY.
+    '''
+    version = data_version()
+    paths = {name: explicity_path(name, version) for name in EXPLICITY}
+    return _from_cache(paths, ('explicity', version), explicity_frequencies,
+                       render_explicity_to_cache, version)
+
+
+def prune(keep):
+    '''
+    Removes the wordclouds of all data versions but one.
+
+    Arguments:
+        keep (str): The data version to keep.
+
+    Returns:
+        int: The number of removed versions.
+    '''
+    if not WORDCLOUD_DIR.exists():
+        return 0
+    removed = 0
+    for path in WORDCLOUD_DIR.iterdir():
+        if path.is_dir() and path.name != keep and VERSION_PATTERN.fullmatch(path.name):
+            shutil.rmtree(path, ignore_errors=True)
+            removed += 1
+    return removed
+
+
+def precompute(workers=None, force=False):
+    '''
+    Renders the wordclouds of every year and location of the lyrics data and
+    the wordclouds of the explicity page, and removes the wordclouds of older
+    data versions.
+
+    Arguments:
+        workers (int): Number of rendering processes, None for one per cpu.
+        force (bool): Also render wordclouds that are already cached.
+
+    Returns:
+        int: The number of rendered year and location combinations and
+        explicity wordcloud pairs.
+    '''
+    df = get_dataset('lyrics')
+    version = data_version()
+    removed = prune(version)
+    if removed:
+        print(f'Removed the wordclouds of {removed} older data versions')
+    combinations = (df.assign(year=df['first_appearance'].dt.year)
+                    .dropna(subset=['year'])[['year', 'location']]
+                    .drop_duplicates().itertuples(index=False))
+    todo = [(str(int(year)), str(location)) for year, location in combinations
+            if force or not all(path.exists() for path in _paths(int(year), location, version).values())]
+    explicity = force or not all(explicity_path(name, version).exists() for name in EXPLICITY)
+
+    with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+        # The n-grams are counted here once, the processes only lay them out
+        futures = {executor.submit(render_to_cache, wordcloud_frequencies(year, location),
+                                   year, location, version): f'{location} {year}'
+                   for year, location in todo}
+        if explicity:
+            futures[executor.submit(render_explicity_to_cache, explicity_frequencies(),
+                                    version)] = 'explicity'
+        for future in as_completed(futures):
+            future.result()
+            print(f'{futures[future]}: done')
+    return len(futures)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Render the wordclouds of the polarity page for every year and location '
+                    'and the wordclouds of the explicity page.')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Number of rendering processes, one per cpu by default.')
+    parser.add_argument('--force', action='store_true',
+                        help='Also render wordclouds that are already cached.')
+    args = parser.parse_args()
+
+    rendered = precompute(args.workers, args.force)
+    print(f'Rendered {rendered} wordclouds into {WORDCLOUD_DIR / data_version()}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,12 @@
+# Gunicorn settings, read by gunicorn app.index:server when it is started in
+# the project folder
+
+# Imports
+import os
+
+# Threaded workers: the threads of a worker share its batching predictor, so
+# concurrent predictions end up in one forward pass. A sync worker serves one
+# request at a time and every batch would hold a single request.
+worker_class = 'gthread'
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+threads = int(os.environ.get('GUNICORN_THREADS', 8))